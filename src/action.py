@@ -1,53 +1,63 @@
-import numpy as np
+class ActionPlan(object):
+    """
+    Flat plan of the motor commands produced by a module, compiled once for a fixed hierarchy.
 
-
-class Action(object):    
-    def __init__(self, m_deps, m_dims=None, operator=None, actions=None):
-        self.m_deps = m_deps
-        self.m_dims = m_dims
+    The output m_deps of the module is split in one slot per space of its m_list, written from 
+    the first step of the module for all the slots with the "par" operator, one slot after the other with "seq".
+    A motor space writes its slot on its motor dims in one step, a sensory space gives its slot as goal
+    to the child module chosen at run time, whose own plan starts at the step of the slot.
+    The modules producing a sensory space can have different numbers of steps: the steps of the slots are 
+    counted at run time (see next_step), and n_iterations is the largest number of steps of the plan.
+    """
+    def __init__(self, mid, operator, slots, n_iterations):
+        self.mid = mid
         self.operator = operator
-        self.actions = actions or []
-        
-        self.n_actions = len(self.actions)
-        self.n_iterations_actions = [action.n_iterations for action in self.actions]
-        self.n_iterations = self.compute_n_iterations()  
-        
-        assert (m_dims is not None) or (operator is not None and actions is not None), (m_dims, operator, actions)
-        
-    
-    def compute_n_iterations(self):
-        if self.operator == "seq":
-            return sum(self.n_iterations_actions)
-        elif self.operator == "par":
-            return max(self.n_iterations_actions)
-        elif self.operator == None:
-            return 1
-        else:
-            raise NotImplementedError
-                  
-    def get_m_seq(self, n_dims):
-        if self.operator == "seq":
-            return [item for action in self.actions for item in action.get_m_seq(n_dims)]
-        elif self.operator == "par":
-            #Warning: "par" of "seq" not implemented
-            return np.sum(np.array([action.get_m_seq(n_dims) for action in self.actions]), axis=0)
-        elif self.operator == None:
-            m = np.zeros((n_dims,))
-            m[self.m_dims] = self.m_deps
-            return [m]
-        else:
-            raise NotImplementedError
-        
-    def print_action(self, depth = 0):
-        for _ in range(depth):
-            print "    ",
-        print "Action", self.operator, self.n_iterations, len(self.actions)
-        if self.operator == "seq":
-            [action.print_action(depth+1) for action in self.actions]
-        elif self.operator == "par":
-            [action.print_action(depth+1) for action in self.actions]            
-        elif self.operator == None:
-            for _ in range(depth):
-                print "    ",
-            print "Primitive Action", self.m_dims
-        
\ No newline at end of file
+        self.slots = slots # (start, end) of each space of m_list: m_deps[start:end]
+        self.n_iterations = n_iterations
+
+    def slot_step(self, n_steps):
+        """ Step of the next slot, relative to the first step of the module, n_steps being the number of steps of the previous slots """
+        return n_steps if self.operator == "seq" else 0
+
+    def next_step(self, n_steps, n_slot):
+        """ Number of steps of the previous slots and of a slot of n_slot steps """
+        return n_steps + n_slot if self.operator == "seq" else max(n_steps, n_slot)
+
+    def print_plan(self):
+        print "Plan", self.mid, self.operator, self.n_iterations
+        for start, end in self.slots:
+            print "    ", "m_deps", start, end
+
+
+def compile_plans(modules, hierarchy):
+    """
+    Returns the plans (dict mid -> ActionPlan) of the modules configured by modules (see Config.modules) in hierarchy.
+    A sensory space takes at most the largest number of steps of the modules producing it.
+    """
+    plans = {}
+
+    def compile_module(mid, ancestors):
+        if mid in plans:
+            return plans[mid]
+        if mid in ancestors:
+            raise ValueError("Cycle in the hierarchy through module " + mid)
+        operator = modules[mid]['operator']
+        if operator not in ["seq", "par"]:
+            raise ValueError("Unknown operator of module " + mid + ": " + str(operator) + " (seq or par)")
+        plan = ActionPlan(mid, operator, [], 0)
+        start = 0
+        for space in modules[mid]['m_list']:
+            if hierarchy.is_motor_space(space):
+                n_space = 1
+            else:
+                n_space = max([compile_module(child, ancestors + [mid]).n_iterations for child in hierarchy.space_children(space)])
+            plan.slots.append((start, start + len(space)))
+            plan.n_iterations = plan.next_step(plan.n_iterations, n_space)
+            start = start + len(space)
+        plans[mid] = plan
+        return plan
+
+    for mid in modules:
+        compile_module(mid, [])
+    return plans
+
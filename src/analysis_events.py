@@ -4,6 +4,8 @@ import numpy as np
 import sys
 import brewer2mpl
 
+from outcomes import outcome_codes, tool_moved, obj_moved
+
 bmap = brewer2mpl.get_map('Dark2', 'qualitative', 6)
 colors = bmap.mpl_colors
 
@@ -107,38 +109,32 @@ def main(log_dir, config):
              
              
              
-            events['hand'][config][trial] = [[0,0]]
-            events['stick'][config][trial] = [[0,0]]
-            events['object'][config][trial] = [[0,0]]
-            events_margins['hand'][config][trial] = [[0,0]]
-            events_margins['stick'][config][trial] = [[0,0]]
-            events_margins['object'][config][trial] = [[0,0]]
-             
             def near_obj(x, y, margin=0.3):
                 return (x)**2. + (y - 1.2)**2. < margin*margin
                  
             def near_one_stick(x, y, margin=0.3):
-                return (x- (-1.17))**2. + (y - 0.67)**2. < margin*margin or (x- (0.96))**2. + (y - 0.46)**2. < margin*margin
+                return ((x- (-1.17))**2. + (y - 0.67)**2. < margin*margin) | ((x- (0.96))**2. + (y - 0.46)**2. < margin*margin)
+            
+            def cumulated(cond):
+                # [[0,0]] then [iteration, number of events up to this iteration] for each event
+                i = np.where(cond)[0] + 1
+                return [[0,0]] + np.column_stack((i, np.arange(1, len(i) + 1))).tolist()
              
-            for i,s in zip(range(1, len(data['agentS'])+1), data['agentS']):
-                #print i, s
-                 
-                if abs(s[21] - (-0.)) > 0.01 or near_obj(s[9], s[12]) or near_obj(s[10], s[13]) or near_obj(s[11], s[14]) or near_obj(s[15], s[18]) or near_obj(s[16], s[19] or near_obj(s[17], s[20])) :
-                    events_margins['object'][config][trial].append([i, events_margins['object'][config][trial][-1][-1] + 1])
-                else:
-                    if abs(s[11] - (-1.17)) > 0.01 or abs(s[17] - (0.96)) > 0.01 or near_one_stick(s[0], s[3]) or near_one_stick(s[1], s[4]) or near_one_stick(s[2], s[5]):
-                        events_margins['stick'][config][trial].append([i, events_margins['stick'][config][trial][-1][-1] + 1])          
-                    else:
-                        events_margins['hand'][config][trial].append([i, events_margins['hand'][config][trial][-1][-1] + 1])
-              
-                     
-                if abs(s[21] - (-0.)) > 0.01:
-                    events['object'][config][trial].append([i, events['object'][config][trial][-1][-1] + 1])
-                else:
-                    if abs(s[11] - (-1.17)) > 0.01 or abs(s[17] - (0.96)) > 0.01:
-                        events['stick'][config][trial].append([i, events['stick'][config][trial][-1][-1] + 1])          
-                    else:
-                        events['hand'][config][trial].append([i, events['hand'][config][trial][-1][-1] + 1])
+            s = np.array(data['agentS'])
+            # Outcomes against the rest positions of the two sticks and of the object
+            outcome = (outcome_codes(-1.17, s[:, 11], s[:, 21], threshold=0.01) | 
+                       outcome_codes(0.96, s[:, 17], s[:, 21], threshold=0.01))
+            
+            obj_margin = (obj_moved(outcome) | near_obj(s[:, 9], s[:, 12]) | near_obj(s[:, 10], s[:, 13]) | near_obj(s[:, 11], s[:, 14]) | 
+                          near_obj(s[:, 15], s[:, 18]) | near_obj(s[:, 16], s[:, 19]) | near_obj(s[:, 17], s[:, 20]))
+            stick_margin = ~obj_margin & (tool_moved(outcome) | near_one_stick(s[:, 0], s[:, 3]) | near_one_stick(s[:, 1], s[:, 4]) | near_one_stick(s[:, 2], s[:, 5]))
+            events_margins['object'][config][trial] = cumulated(obj_margin)
+            events_margins['stick'][config][trial] = cumulated(stick_margin)
+            events_margins['hand'][config][trial] = cumulated(~obj_margin & ~stick_margin)
+            
+            events['object'][config][trial] = cumulated(obj_moved(outcome))
+            events['stick'][config][trial] = cumulated(~obj_moved(outcome) & tool_moved(outcome))
+            events['hand'][config][trial] = cumulated(outcome == 0)
               
             logs_c = {}
              
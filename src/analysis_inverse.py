@@ -1,3 +1,4 @@
+import os
 import cPickle
 import numpy as np
 import sys
@@ -6,18 +7,11 @@ from experiment import ToolsExperiment
 from explauto.experiment.log import ExperimentLog
 from config import configs
 from explauto.utils import rand_bounds
+from outcomes import classify_outcomes, tool_used
 
 
 def strategy_used(s):
-    obj_end_pos_y = s[1] + s[-1]
-    tool1_moved = (abs(s[-6] - s[-4]) > 0.0001)
-    #tool2_moved = (abs(ms[-5] - ms[-3]) > 0.0001)
-    tool1_touched_obj = tool1_moved and (abs(s[-4] - obj_end_pos_y) < 0.0001)
-    #tool2_touched_obj = tool2_moved and (abs(ms[-3] - obj_end_pos_y) < 0.0001)
-    obj_moved = abs(s[-1]) > 0.0001
-    obj_moved_with_hand = obj_moved and (not tool1_touched_obj)# and (not tool2_touched_obj)
-    
-    if tool1_touched_obj or (tool1_moved and not obj_moved_with_hand):
+    if tool_used(classify_outcomes(s)):
         print "tool moved"
         return "tool"
     else:
@@ -35,7 +29,7 @@ def main(log_dir, config_name, trial):
     
     
     log = ExperimentLog(None, None, None)
-    for key in ["motor", "sensori"]:
+    for key in ["bootstrap", "motor", "sensori"]:
         try:
             filename = log_dir + config_name + '/log{}-'.format(trial) + key + '-{}.pickle'.format(0)
             with open(filename, 'r') as f:
@@ -53,16 +47,23 @@ def main(log_dir, config_name, trial):
     results_strategies_2 = {}
     results_strategies_3 = {}
     
-    for iteration in iterations:
+    # One agent grows through the ages, the problems are solved by a snapshot of the agent at each age
+    xp = ToolsExperiment(config, context_mode=config.context_mode)
+    age = 0
+    
+    for iteration in sorted(iterations):
         print iteration
         
-        xp = ToolsExperiment(config, context_mode=config.context_mode)
-        
-        log_i = ExperimentLog(None, None, None)
-        log_i._logs["motor"] = log._logs["motor"][:iteration]
-        log_i._logs["sensori"] = log._logs["sensori"][:iteration]
+        # A checkpoint holds the sensorimotor models rebuilt by the replay of the logs (see ToolsExperiment.fast_forward_log)
+        checkpoint = log_dir + config_name + '/checkpoint{}-{}.pickle'.format(trial, iteration)
+        if os.path.exists(checkpoint):
+            xp.ag.load_checkpoint(checkpoint)
+        else:
+            xp.fast_forward_log(log, age, iteration)
+        age = iteration
         
-        xp.ag.fast_forward(log_i, forward_im=False)
+        ag = xp.ag.snapshot()
+        xp.env.reset()
         
         s_space = "s_o"
         
@@ -159,11 +160,11 @@ def main(log_dir, config_name, trial):
             #print "ds goal", sg
             for i in range(n_iter_max):
                 context = xp.env.get_current_context()
-                m = xp.ag.inverse(s_space, sg, context=context, babbling=True, explore=None)[0]
+                m = ag.inverse(s_space, sg, context=context, babbling=True, explore=None)[0]
                 #print "m", m
                 sr = xp.env.update(m, reset=False)
                 #print "s", sr
-                xp.ag.perceive([sr], context=context)
+                ag.perceive([sr], context=context)
                 results_strategies_3_i[p3].append(strategy_used(sr))
                 if abs(sr[-1]) > 0.0001:
                     results_niter_3_i[p3] = i
@@ -1,3 +1,4 @@
+import os
 import cPickle
 import numpy as np
 import sys
@@ -19,7 +20,7 @@ def main(log_dir, config_name, trial):
     
     
     log = ExperimentLog(None, None, None)
-    for key in ["motor", "sensori"]:
+    for key in ["bootstrap", "motor", "sensori"]:
         try:
             filename = log_dir + config_name + '/log{}-'.format(trial) + key + '-{}.pickle'.format(0)
             with open(filename, 'r') as f:
@@ -34,33 +35,35 @@ def main(log_dir, config_name, trial):
     
     results = {}
     
-    for iteration in iterations:
+    # One agent grows through the ages: the map only queries the agent, which is not modified
+    xp = ToolsExperiment(config, context_mode=config.context_mode)
+    age = 0
+    
+    for iteration in sorted(iterations):
         print iteration
         results[iteration] = {}
         
-        xp = ToolsExperiment(config, context_mode=config.context_mode)
-        
-        log_i = ExperimentLog(None, None, None)
-        log_i._logs["motor"] = log._logs["motor"][:iteration]
-        log_i._logs["sensori"] = log._logs["sensori"][:iteration]
-        
-        xp.ag.fast_forward(log_i, forward_im=False)
+        # A checkpoint holds the sensorimotor models rebuilt by the replay of the logs (see ToolsExperiment.fast_forward_log)
+        checkpoint = log_dir + config_name + '/checkpoint{}-{}.pickle'.format(trial, iteration)
+        if os.path.exists(checkpoint):
+            xp.ag.load_checkpoint(checkpoint)
+        else:
+            xp.fast_forward_log(log, age, iteration)
+        age = iteration
         
         s_space = xp.ag.config.s_spaces["s_o"]
         
         
         n_test_point = 100
-        n_trial_per_point = 100
         
         x_points = np.linspace(-1.5, 1.5, n_test_point)
         y_points = np.linspace(-1.5, 1.5, n_test_point)
          
         results[iteration] = np.zeros((n_test_point, n_test_point))
         
-        for ix in range(len(x_points)):
-            for iy in range(len(y_points)):
-                probas = xp.ag.choose_space_child(s_space, [x_points[ix], y_points[iy]], mode=xp.ag.choose_children_mode, local=xp.ag.ccm_local, k=n_trial_per_point)
-                results[iteration][ix][iy] = probas[0]
+        grid = np.array([[x, y] for x in x_points for y in y_points])
+        probas = xp.ag.choose_space_child_probas(s_space, grid, mode=xp.ag.choose_children_mode, local=xp.ag.ccm_local)
+        results[iteration] = probas[:, 0].reshape((len(x_points), len(y_points)))
                 
                 
         # Plot 
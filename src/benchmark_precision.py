@@ -0,0 +1,107 @@
+"""
+Validation benchmark of the float32 storage of the datasets (Config precision='float32'):
+runs the same trials (same seeds) with float64 and float32 datasets, and compares
+the memory of the sensorimotor datasets, the time, the outcomes of the movements and the competences.
+
+The memory is measured in two ways:
+- nbytes: the arrays of the points and the nearest neighbors indexes of the sensorimotor datasets.
+  scipy's kd-trees keep a float64 copy of the points whatever the type of the data,
+  so float32 only halves the arrays, not the trees.
+- peak_rss: the growth of the peak resident memory of the process during the trial
+  (each trial runs in its own process), which also counts the logs and the interest models.
+
+The two precisions pick different nearest neighbors on ties and near-ties, so the trials diverge:
+the outcomes are compared in distribution over the trials, not movement by movement.
+
+Usage: python benchmark_precision.py log_dir iterations n_trials [supervisor_ccm]
+"""
+
+import os
+import sys
+import time
+import resource
+import multiprocessing
+import numpy as np
+
+from config import Config
+from experiment import ToolsExperiment
+from outcomes import classify_outcomes, tool_moved, obj_moved
+
+
+def outcomes(s_list):
+    """
+    Number of movements where the object moved, and where the tool moved without moving the object.
+    s_list: sensory logs (context then the 15 sensory dims)
+    """
+    codes = classify_outcomes(s_list)
+    return np.sum(obj_moved(codes)), np.sum(tool_moved(codes) & ~obj_moved(codes))
+
+
+def sm_datasets_nbytes(ag):
+    return sum([mod.sensorimotor_model.model.imodel.fmodel.dataset.nbytes() for mod in ag.modules.values()])
+
+
+def peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 # ru_maxrss is in kilobytes on Linux
+
+
+def run_trial(log_dir, precision, iterations, seed, supervisor_ccm):
+    config = Config(name="bench-" + precision, 
+                    hierarchy_type=1, 
+                    supervisor_name="interest", 
+                    supervisor_ccm=supervisor_ccm, 
+                    supervisor_ccl="local", 
+                    sm_model='incremental_knn', 
+                    precision=precision, 
+                    iterations=iterations)
+    config.env_cfg["env_conf"]["gui"] = False
+    np.random.seed(seed)
+    xp = ToolsExperiment(config=config, context_mode=config.context_mode, log_dir=log_dir)
+    xp.trial = seed
+    rss_start = peak_rss()
+    t_start = time.time()
+    xp.motor_babbling(config.bootstrap)
+    xp.run(iterations)
+    duration = time.time() - t_start
+    n_obj, n_tool = outcomes(xp.log.logs['sensori'])
+    return dict(time=duration, 
+                nbytes=sm_datasets_nbytes(xp.ag), 
+                peak_rss=peak_rss() - rss_start, 
+                obj_moved=n_obj, 
+                tool_moved=n_tool, 
+                competences=dict((mid, mod.competence()) for mid, mod in xp.ag.modules.items()))
+
+
+def main(log_dir, iterations, n_trials, supervisor_ccm="competence"):
+    if not os.path.exists(log_dir):
+        os.mkdir(log_dir)
+    results = {}
+    for precision in ['float64', 'float32']:
+        results[precision] = []
+        for seed in range(n_trials):
+            # A new process per trial, so that its peak memory is not the one of a previous trial
+            pool = multiprocessing.Pool(1)
+            results[precision].append(pool.apply(run_trial, (log_dir, precision, iterations, seed, supervisor_ccm)))
+            pool.close()
+            pool.join()
+    
+    print
+    print "Precision benchmark,", n_trials, "trials of", iterations, "iterations"
+    for key in ['time', 'nbytes', 'peak_rss', 'obj_moved', 'tool_moved']:
+        v64 = np.array([r[key] for r in results['float64']], dtype=float)
+        v32 = np.array([r[key] for r in results['float32']], dtype=float)
+        print key, "float64: {:.4g} +- {:.2g}".format(np.mean(v64), np.std(v64)), "float32: {:.4g} +- {:.2g}".format(np.mean(v32), np.std(v32)), "ratio: {:.3f}".format(np.mean(v32) / np.mean(v64))
+    for mid in sorted(results['float64'][0]['competences'].keys()):
+        c64 = [r['competences'][mid] for r in results['float64']]
+        c32 = [r['competences'][mid] for r in results['float32']]
+        print "competence", mid, "float64: {:.4g} +- {:.2g}".format(np.mean(c64), np.std(c64)), "float32: {:.4g} +- {:.2g}".format(np.mean(c32), np.std(c32))
+    return results
+
+
+if __name__ == "__main__":
+    
+    log_dir = sys.argv[1]
+    iterations = int(sys.argv[2])
+    n_trials = int(sys.argv[3])
+    supervisor_ccm = sys.argv[4] if len(sys.argv) > 4 else "competence"
+    main(log_dir, iterations, n_trials, supervisor_ccm)
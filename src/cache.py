@@ -0,0 +1,51 @@
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """ 
+    Bounded dictionary dropping the least recently used items, with hit/miss statistics.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+    def __len__(self):
+        return len(self.items)
+        
+    def get(self, key):
+        """ 
+        Return the item stored at key, or None.
+        """
+        try:
+            value = self.items.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        self.items[key] = value
+        self.hits += 1
+        return value
+    
+    def put(self, key, value):
+        """ 
+        Store an item, dropping the least recently used one if the cache is full.
+        """
+        self.items.pop(key, None)
+        self.items[key] = value
+        if len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+            self.evictions += 1
+            
+    def clear(self):
+        self.items.clear()
+        
+    def stats(self):
+        n = self.hits + self.misses
+        return dict(size=len(self.items),
+                    max_size=self.max_size,
+                    hits=self.hits,
+                    misses=self.misses,
+                    evictions=self.evictions,
+                    hit_rate=float(self.hits) / n if n > 0 else 0.)
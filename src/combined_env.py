@@ -100,22 +100,20 @@ class HierarchicallyCombinedEnvironment(Environment):
         return m
     
     def compute_sensori_effect(self, m):
-        if len(np.array(m).shape) == 1:
-            s_lower = list(self.lower_env.update(self.fun_m_lower(m), reset=False, log=False))
-            s_lower_upd = self.fun_s_lower(m, s_lower)
-        else:
-            results_lower = list(self.lower_env.update(self.fun_m_lower(m), reset=False, log=False))
-            s_lower = []
-            s_lower_upd = []
-            if isinstance(results_lower[-1], list):
-                for i in range(len(m)):   
-                    s_lower.append(results_lower[i])
-                    s_lower_upd.append(self.fun_s_lower(m, s_lower[-1]))
-            else: # if lower env take a trajectory as input but output only one state
-                #print "No", isinstance(results_lower[0], list), results_lower[0], results_lower, np.array(results_lower).shape
-                s_lower = results_lower
-                s_lower_upd = self.fun_s_lower(m, s_lower)
-        top_upd = list(self.top_env.update(s_lower_upd, reset=False, log=False))
+        """ fun_s_lower and fun_s_top are given arrays: one state of shape (n,), 
+        or a whole trajectory of shape (T, n) if the lower env computed a trajectory
+        """
+        m = np.asarray(m)
+        s_lower = np.asarray(self.lower_env.update(self.fun_m_lower(m), reset=False, log=False))
+        s_lower_upd = self.fun_s_lower(m, s_lower)
+        if m.ndim == 2 and s_lower.ndim == 2:
+            # Trajectory: the lower env computed all the steps, the top env follows it
+            top_upd = np.asarray(self.top_env.update(s_lower_upd, reset=False, log=False))
+            s = self.fun_s_top(m, s_lower, top_upd)
+            assert s.shape[-1] == self.conf.s_ndims
+            return s
+        # else one state, also if lower env take a trajectory as input but output only one state
+        top_upd = np.asarray(self.top_env.update(s_lower_upd, reset=False, log=False))
         
         s = self.fun_s_top(m, s_lower, top_upd)
         #print "HC len(s)", len(s), "len(m)", len(m), "len(s_lower)", len(s_lower), "len(top_upd)", len(top_upd)
@@ -123,12 +121,21 @@ class HierarchicallyCombinedEnvironment(Environment):
         assert len(s) == self.conf.s_ndims
         return s
 
-#     def update(self, m, reset=False, log=True, batch=False):
-#         if reset:
-#             self.reset()
-#         s = self.one_update(m, log)
-#         return s
-    
+    def update(self, m, reset=True, log=True):
+        """ A trajectory of shape (T, n) is given at once to compute_sensori_effect,
+        so that the lower environments can compute it as a whole
+        """
+        if np.ndim(m) == 1:
+            return Environment.update(self, m, reset, log)
+        if reset:
+            self.reset()
+        s = self.compute_sensori_effect(m)
+        if log:
+            for m_t, s_t in zip(m, s):
+                self.emit('motor', m_t)
+                self.emit('sensori', s_t)
+        return np.asarray(s)
+
     def plot(self, ax, i, **kwargs_plot):
         self.lower_env.plot(ax, i, **kwargs_plot)
         self.top_env.plot(ax, i, **kwargs_plot)
@@ -2,6 +2,8 @@ import numpy as np
 
 from explauto.utils.config import make_configuration
 from explauto.sensorimotor_model.non_parametric import NonParametric, ContextNonParametric
+from sensorimotor_model import IncrementalNonParametric, IncrementalContextNonParametric, BoundedNonParametric, BoundedContextNonParametric
+from interest_model import CompactMiscRandomInterest, CompactContextRandomInterest, IncrementalMiscRandomInterest, IncrementalContextRandomInterest
 from supervisor import Supervisor
 from environment import ICDL2016Environment
 from explauto.environment.context_environment import ContextEnvironment
@@ -19,6 +21,13 @@ class Config(object):
                  supervisor_ccm="competence", 
                  supervisor_ccl="local", 
                  im_model='miscRandom_local',
+                 im_backend='explauto',
+                 sm_model='knn',
+                 sm_capacity=100000,
+                 sm_retention='reservoir',
+                 precision='float64',
+                 context_index='kdtree',
+                 no_effect_resolution=None,
                  tdd=False,
                  ns=False,
                  perturbation=None,
@@ -33,11 +42,13 @@ class Config(object):
         self.bootstrap_range_div = 1.
         self.iter = iterations or 50
         self.log_each = self.iter #must be <= iter
+        self.checkpoint_at = [] # iterations at which the state of the agent is saved (see Supervisor.save_checkpoint)
+        self.metrics_interval = 200 # iterations between two rows of the metrics file of a trial (see metrics.Metrics), None to disable
         self.eval_at = []
         self.n_eval = 0
         self.eval_modes = []
         
-        self.gui = True
+        self.gui = True # True: plot each movement, 'live': plot in a separate process, dropping movements if it lags behind
         
         self.hierarchy_type = hierarchy_type
         self.babbling_name = babbling_name
@@ -79,6 +90,14 @@ class Config(object):
         self.sensori_dims = range(self.motor_n_dims, self.motor_n_dims + self.s_n_dims)
         self.used_dims = self.motor_n_dims + self.s_n_dims
         
+        self.precision = precision # 'float64' or 'float32' (storage and nearest neighbors distances of the datasets, needs an incremental sm_model)
+        if self.precision == 'float64':
+            self.dtype = np.float64
+        elif self.precision == 'float32':
+            self.dtype = np.float32
+        else:
+            raise NotImplementedError
+        
         self.im_model = im_model
         self.im_name = self.im_model        
         
@@ -97,17 +116,58 @@ class Config(object):
                                    'progress_mode': 'local',
                                    'context_mode': self.context_mode}),
             }
+        self.im_backend = im_backend # 'explauto' or 'incremental' (same interest models with indexed points and running window sums)
+        if self.im_backend == 'incremental':
+            incremental_ims = {MiscRandomInterest: IncrementalMiscRandomInterest, ContextRandomInterest: IncrementalContextRandomInterest}
+            for name, (im_cls, im_kwargs) in self.ims.items():
+                self.ims[name] = (incremental_ims[im_cls], dict(im_kwargs, dtype=self.dtype))
+        elif self.im_backend != 'explauto':
+            raise NotImplementedError
+        elif self.precision == 'float32':
+            compact_ims = {MiscRandomInterest: CompactMiscRandomInterest, ContextRandomInterest: CompactContextRandomInterest}
+            for name, (im_cls, im_kwargs) in self.ims.items():
+                self.ims[name] = (compact_ims[im_cls], dict(im_kwargs, dtype=self.dtype))
         
         self.choose_children_local = (supervisor_ccl == 'local')
         
         self.sms = {
             'knn1': (NonParametric, {'fwd': 'NN', 'inv': 'NN', 'sigma_explo_ratio':0.01}),
             'context_knn': (ContextNonParametric, {'fwd': 'NN', 'inv': 'NN', 'sigma_explo_ratio':0.01,'context_mode': self.context_mode}),
+            'incremental_knn1': (IncrementalNonParametric, {'fwd': 'NN', 'inv': 'NN', 'sigma_explo_ratio':0.01, 'dtype': self.dtype}),
+            'incremental_context_knn': (IncrementalContextNonParametric, {'fwd': 'NN', 'inv': 'NN', 'sigma_explo_ratio':0.01,'context_mode': self.context_mode, 'dtype': self.dtype}),
+            'bounded_knn1': (BoundedNonParametric, {'fwd': 'NN', 'inv': 'NN', 'sigma_explo_ratio':0.01, 'dtype': self.dtype, 
+                                                    'capacity': sm_capacity, 'retention': sm_retention}),
+            'bounded_context_knn': (BoundedContextNonParametric, {'fwd': 'NN', 'inv': 'NN', 'sigma_explo_ratio':0.01,'context_mode': self.context_mode, 'dtype': self.dtype, 
+                                                                  'capacity': sm_capacity, 'retention': sm_retention}),
         }
+        
+        self.context_index = context_index # 'kdtree' or 'grid' (context queries of the incremental context models on a grid of 32x32 cells)
+        if self.context_index == 'grid':
+            self.sms['incremental_context_knn'][1]['grid_size'] = 32
+        elif self.context_index != 'kdtree':
+            raise NotImplementedError
           
-          
-        sm = 'knn1'
+        self.sm_model = sm_model # 'knn', 'incremental_knn' (growable dataset with incremental kd-trees), 'shared_knn' (incremental_knn on one store of the ms rows shared by the modules) 
+                                 # or 'bounded_knn' (at most sm_capacity points per module, kept with the sm_retention policy: 'reservoir', 'recency' or 'coverage')
+        self.shared_sm_store = (self.sm_model == 'shared_knn')
+        if self.sm_model == 'knn':
+            if self.precision != 'float64' or self.context_index != 'kdtree':
+                raise NotImplementedError
+            sm = 'knn1'
+            context_sm = 'context_knn'
+        elif self.sm_model in ['incremental_knn', 'shared_knn']:
+            sm = 'incremental_knn1'
+            context_sm = 'incremental_context_knn'
+        elif self.sm_model == 'bounded_knn':
+            if self.context_index != 'kdtree':
+                raise NotImplementedError
+            sm = 'bounded_knn1'
+            context_sm = 'bounded_context_knn'
+        else:
+            raise NotImplementedError
         im_mode = 'sg'
+        
+        self.no_effect_resolution = no_effect_resolution # None, or the cell size of the sensory space of mod3 (context, min_dist and object move) within which it stores only one movement that did not move the object (e.g. 0.1)
         self.std_range = [-1.,1.]
         
         
@@ -181,7 +241,7 @@ class Config(object):
                                           m_list = [self.s_spaces["s_h"]],      
                                           operator = "par",                            
                                           babbling_name = "goal",
-                                          sm_name = 'context_knn',
+                                          sm_name = context_sm,
                                           im_name = 'context_miscRandom_local',
                                           im_mode = im_mode,
                                           from_log = None,
@@ -193,7 +253,7 @@ class Config(object):
                                           m_list = [self.s_spaces["s_t1"]],      
                                           operator = "par",                            
                                           babbling_name = "goal",
-                                          sm_name = 'context_knn',
+                                          sm_name = context_sm,
                                           im_name = 'context_miscRandom_local',
                                           im_mode = im_mode,
                                           from_log = None,
@@ -205,7 +265,7 @@ class Config(object):
 #                                           m_list = [self.s_spaces["s_t2"]],      
 #                                           operator = "par",                            
 #                                           babbling_name = "goal",
-#                                           sm_name = 'context_knn',
+#                                           sm_name = context_sm,
 #                                           im_name = 'context_miscRandom_local',
 #                                           im_mode = im_mode,
 #                                           from_log = None,
@@ -281,9 +341,12 @@ class Config(object):
 
 
         
+        self.rollout_cache_size = 0 # number of arm and stick trajectories memoized by the environment, 0 to disable
+        
         iccm_conf = dict(move_steps=self.move_steps, 
                             max_params=self.max_params,
-                            gui=self.gui)
+                            gui=self.gui,
+                            rollout_cache_size=self.rollout_cache_size)
 
 
 
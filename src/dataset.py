@@ -0,0 +1,1028 @@
+import copy
+import itertools
+import numpy as np
+import scipy.spatial
+
+
+KDTREE_NODE_NBYTES = 72 # size of a node of scipy's cKDTree (9 fields of 8 bytes)
+
+
+def kdtree_nbytes(tree):
+    """
+    Memory of a scipy cKDTree, in bytes: its copy of the points (always float64, whatever the type of the data),
+    the permutation of their indexes and its nodes.
+    """
+    return tree.data.nbytes + tree.indices.nbytes + tree.size * KDTREE_NODE_NBYTES
+
+
+class IncrementalIndex(object):
+    """
+    Nearest neighbors index on the columns cols of the rows of a growing array,
+    or of the rows rows[:n] of the array if a growing array of row indexes is given.
+
+    The rows are covered by kd-trees on consecutive ranges of decreasing sizes leaf_size * 2^i,
+    merged as in a binary counter when a range is full, and the last rows (less than leaf_size)
+    are searched exhaustively. A row is thus copied in O(log(n)) tree builds and a query looks in O(log(n)) trees.
+    """
+    def __init__(self, cols, leaf_size=1024):
+        self.cols = cols
+        self.leaf_size = leaf_size
+        self.trees = [] # (start, end, kd-tree of the rows start:end)
+        self.n_indexed = 0
+
+    def snapshot(self):
+        """
+        Copy of the index sharing its kd-trees, which are replaced but never modified.
+        """
+        index = copy.copy(self)
+        index.trees = list(self.trees)
+        return index
+
+    def nbytes(self):
+        return sum([kdtree_nbytes(tree) for _, _, tree in self.trees])
+
+    def points(self, data, start, end, rows=None):
+        if rows is None:
+            return data[start:end, self.cols]
+        else:
+            return data[rows[start:end]][:, self.cols]
+
+    def update(self, data, n, rows=None):
+        """
+        Index the rows of data[:n] (or data[rows[:n]]) that are not yet in a tree.
+        """
+        while n - self.n_indexed >= self.leaf_size:
+            size = self.leaf_size * 2 ** int(np.log2((n - self.n_indexed) / self.leaf_size))
+            if len(self.trees) > 0:
+                size = min(size, self.trees[-1][1] - self.trees[-1][0])
+            self.trees.append((self.n_indexed, self.n_indexed + size, None))
+            self.n_indexed += size
+            while len(self.trees) > 1 and self.trees[-1][1] - self.trees[-1][0] == self.trees[-2][1] - self.trees[-2][0]:
+                end = self.trees.pop()[1]
+                self.trees[-1] = (self.trees[-1][0], end, None)
+            start, end, _ = self.trees[-1]
+            # Sliding midpoint splits: the median splits are very slow to build on many duplicate points
+            self.trees[-1] = (start, end, scipy.spatial.cKDTree(self.points(data, start, end, rows), balanced_tree=False))
+
+    def query(self, data, n, v, k=1, radius=np.inf, eps=0.0, p=2, rows=None):
+        """
+        Return the distances and indexes of the k nearest neighbors of v among the rows of data[:n]
+        (or data[rows[:n]], the indexes are then positions in rows),
+        sorted by distance then index, and padded with inf and n if there are less than k points within radius.
+        """
+        self.update(data, n, rows)
+        if k == 1:
+            # The ranges are in increasing order of indexes: on ties the first one found is kept
+            best_d, best_i = np.inf, n
+            for start, end, tree in self.trees:
+                d, i = tree.query(v, k=1, distance_upper_bound=radius, eps=eps, p=p)
+                if d < best_d:
+                    best_d, best_i = d, start + i
+            if self.n_indexed < n:
+                d = self.distances(self.points(data, self.n_indexed, n, rows), v, p)
+                i = np.argmin(d)
+                if d[i] < best_d and d[i] < radius:
+                    best_d, best_i = d[i], self.n_indexed + i
+            return np.array([best_d]), [int(best_i)]
+        dists = []
+        idxs = []
+        for start, end, tree in self.trees:
+            d, i = tree.query(v, k=min(k, end - start), distance_upper_bound=radius, eps=eps, p=p)
+            d, i = np.atleast_1d(d), np.atleast_1d(i)
+            found = i < end - start
+            dists.append(d[found])
+            idxs.append(i[found] + start)
+        if self.n_indexed < n:
+            d = self.distances(self.points(data, self.n_indexed, n, rows), v, p)
+            found = d < radius
+            dists.append(d[found])
+            idxs.append(np.arange(self.n_indexed, n)[found])
+        dists = np.concatenate(dists)
+        idxs = np.concatenate(idxs)
+        order = np.lexsort((idxs, dists))[:k]
+        dists = np.append(dists[order], [np.inf] * (k - len(order)))
+        idxs = np.append(idxs[order], [n] * (k - len(order)))
+        return dists, [int(i) for i in idxs]
+
+    def query_batch(self, data, n, vs, k=1, radius=np.inf, eps=0.0, p=2, rows=None):
+        """
+        Same as query for each row of vs, with one query of each kd-tree for all the rows:
+        returns arrays of shape (len(vs), k).
+        """
+        self.update(data, n, rows)
+        vs = np.atleast_2d(vs)
+        dists = []
+        idxs = []
+        for start, end, tree in self.trees:
+            k_tree = min(k, end - start)
+            d, i = tree.query(vs, k=k_tree, distance_upper_bound=radius, eps=eps, p=p)
+            d, i = d.reshape(len(vs), k_tree), i.reshape(len(vs), k_tree)
+            dists.append(d)
+            idxs.append(np.where(i < end - start, i + start, n))
+        if self.n_indexed < n:
+            points = self.points(data, self.n_indexed, n, rows)
+            d = np.vstack([self.distances_batch(points, vs[i:i + 1024], p) for i in range(0, len(vs), 1024)])
+            dists.append(np.where(d < radius, d, np.inf))
+            idxs.append(np.where(d < radius, np.arange(self.n_indexed, n)[None, :], n))
+        dists = np.hstack(dists)
+        idxs = np.hstack(idxs)
+        order = np.lexsort((idxs, dists))[:, :k]
+        rows_ = np.arange(len(vs))[:, None]
+        dists, idxs = dists[rows_, order], idxs[rows_, order]
+        if dists.shape[1] < k:
+            dists = np.hstack((dists, np.inf * np.ones((len(vs), k - dists.shape[1]))))
+            idxs = np.hstack((idxs, n * np.ones((len(vs), k - idxs.shape[1]), dtype=int)))
+        return dists, idxs
+
+    @staticmethod
+    def distances_batch(points, vs, p=2):
+        """
+        Minkowski p-distances between the rows of vs and the rows of points, of shape (len(vs), len(points)),
+        computed as in distances
+        """
+        total = np.zeros((len(vs), len(points)), dtype=np.result_type(points, vs))
+        for j in range(points.shape[1]):
+            diff = np.abs(points[None, :, j] - vs[:, j, None])
+            if p == 2:
+                total += diff * diff
+            elif p == np.inf:
+                total = np.maximum(total, diff)
+            else:
+                total += diff ** p
+        if p == 2:
+            return np.sqrt(total)
+        elif p == np.inf:
+            return total
+        else:
+            return total ** (1. / p)
+
+    @staticmethod
+    def distances(points, v, p=2):
+        """
+        Minkowski p-distances between the rows of points and v
+        """
+        diff = np.abs(points - v)
+        if p == 2:
+            return np.sqrt(np.sum(diff * diff, axis=1))
+        elif p == np.inf:
+            return np.max(diff, axis=1)
+        else:
+            return np.sum(diff ** p, axis=1) ** (1. / p)
+
+
+class GridIndex(object):
+    """
+    Exact nearest neighbors index on the columns cols of the rows of a growing array (or of data[rows[:n]]),
+    whose rows are bucketed on a uniform grid of n_cells^d cells over the columns grid_cols (a subset of cols,
+    e.g. the context dimensions) within bounds, the rows out of bounds going to the border cells.
+
+    A query scans the cells by rings of increasing size around the cell of v, and stops when the k-th distance found
+    is less than the distance from v to the cells not scanned yet, which bounds the distance to their rows:
+    queries conditioned on a grid position cost the scan of a few cells whatever the number of rows.
+    Each cell keeps a copy of the columns cols of its rows.
+    """
+    def __init__(self, cols, grid_cols, bounds, n_cells=32):
+        self.cols = list(cols)
+        self.grid_pos = [self.cols.index(c) for c in grid_cols] # positions of the grid columns in v
+        self.mins = np.array(bounds[0], dtype=float)
+        self.cell_size = (np.array(bounds[1], dtype=float) - self.mins) / n_cells
+        self.n_cells = n_cells
+        self.cells = {} # cell -> [indexes of the rows in the cell, their columns cols, number of rows]
+        self.rings = {} # r -> offsets of the cells at distance r (in cells, max norm)
+        self.n_indexed = 0
+
+    def snapshot(self):
+        """
+        Copy of the index: the cells are filled in place and are copied.
+        """
+        index = copy.copy(self)
+        index.cells = dict((cell, [block[0].copy(), block[1].copy(), block[2]]) for cell, block in self.cells.iteritems())
+        return index
+
+    def nbytes(self):
+        return sum([block[0].nbytes + block[1].nbytes for block in self.cells.values()])
+
+    def cell_of(self, v_grid):
+        return np.clip(np.floor((v_grid - self.mins) / self.cell_size).astype(int), 0, self.n_cells - 1)
+
+    def update(self, data, n, rows=None):
+        """
+        Add the rows of data[:n] (or data[rows[:n]]) that are not yet in a cell.
+        """
+        if self.n_indexed < n:
+            if rows is None:
+                points = data[self.n_indexed:n][:, self.cols]
+            else:
+                points = data[rows[self.n_indexed:n]][:, self.cols]
+            cells = self.cell_of(points[:, self.grid_pos])
+            for i, cell, point in zip(range(self.n_indexed, n), map(tuple, cells), points):
+                if cell not in self.cells:
+                    self.cells[cell] = [np.zeros(16, dtype=int), np.zeros((16, len(self.cols)), dtype=data.dtype), 0]
+                block = self.cells[cell]
+                if block[2] == len(block[0]):
+                    block[0] = np.append(block[0], np.zeros(block[2], dtype=int))
+                    block[1] = np.vstack((block[1], np.zeros(block[1].shape, dtype=data.dtype)))
+                block[0][block[2]] = i
+                block[1][block[2]] = point
+                block[2] += 1
+            self.n_indexed = n
+
+    def ring(self, r):
+        if r not in self.rings:
+            offsets = np.array(list(itertools.product(range(-r, r + 1), repeat=len(self.grid_pos))), dtype=int)
+            self.rings[r] = offsets[np.max(np.abs(offsets), axis=1) == r]
+        return self.rings[r]
+
+    def query(self, data, n, v, k=1, radius=np.inf, eps=0.0, p=2, rows=None):
+        """
+        Return the distances and indexes of the k nearest neighbors of v among the rows of data[:n]
+        (or data[rows[:n]], the indexes are then positions in rows),
+        sorted by distance then index, and padded with inf and n if there are less than k points within radius.
+        eps is ignored: the neighbors are exact.
+        """
+        self.update(data, n, rows)
+        v_grid = v[self.grid_pos]
+        center = self.cell_of(v_grid)
+        dists = []
+        idxs = []
+        n_found = 0
+        r = 0
+        while True:
+            cells = center + self.ring(r)
+            cells = cells[np.all((cells >= 0) & (cells < self.n_cells), axis=1)]
+            for cell in map(tuple, cells):
+                if cell in self.cells:
+                    cell_idxs, points, size = self.cells[cell]
+                    d = IncrementalIndex.distances(points[:size], v, p)
+                    found = d < radius
+                    dists.append(d[found])
+                    idxs.append(cell_idxs[:size][found])
+                    n_found += np.sum(found)
+            # Distance from v to the cells out of the scanned block (the border cells extend to infinity)
+            low, high = center - r, center + r
+            bound = np.inf
+            for j in range(len(center)):
+                if low[j] > 0:
+                    bound = min(bound, v_grid[j] - (self.mins[j] + low[j] * self.cell_size[j]))
+                if high[j] < self.n_cells - 1:
+                    bound = min(bound, self.mins[j] + (high[j] + 1) * self.cell_size[j] - v_grid[j])
+            if bound == np.inf or bound >= radius:
+                break
+            if n_found >= k:
+                dists = [np.concatenate(dists)]
+                idxs = [np.concatenate(idxs)]
+                if np.partition(dists[0], k - 1)[k - 1] < bound:
+                    break
+            r += 1
+        dists = np.concatenate(dists) if len(dists) > 0 else np.zeros(0)
+        idxs = np.concatenate(idxs) if len(idxs) > 0 else np.zeros(0, dtype=int)
+        order = np.lexsort((idxs, dists))[:k]
+        dists = np.append(dists[order], [np.inf] * (k - len(order)))
+        idxs = np.append(idxs[order], [n] * (k - len(order)))
+        return dists, [int(i) for i in idxs]
+
+
+class SnapshotIndex(object):
+    """
+    Nearest neighbors index on the columns cols of the rows of an array whose rows can be replaced.
+
+    A kd-tree is built on a snapshot of the rows, the rows replaced (touched) or added since are searched exhaustively
+    and their stale entries in the tree are skipped. The tree is rebuilt when more than rebuild_size rows changed:
+    with a fixed number of rows, the cost of a query and the amortized cost of an update are bounded.
+    """
+    def __init__(self, cols, rebuild_size=1024):
+        self.cols = cols
+        self.rebuild_size = rebuild_size
+        self.tree = None
+        self.n_tree = 0 # number of rows in the tree
+        self.touched = [] # rows of the tree replaced since it was built
+        self.is_touched = np.zeros(0, dtype=bool)
+
+    def touch(self, i):
+        if i < self.n_tree and not self.is_touched[i]:
+            self.touched.append(i)
+            self.is_touched[i] = True
+
+    def nbytes(self):
+        return (kdtree_nbytes(self.tree) if self.tree is not None else 0) + self.is_touched.nbytes
+
+    def query(self, data, n, v, k=1, radius=np.inf, eps=0.0, p=2):
+        """
+        Return the distances and indexes of the k nearest neighbors of v among the rows of data[:n],
+        sorted by distance then index, and padded with inf and n if there are less than k points within radius.
+        """
+        if self.tree is None or len(self.touched) + n - self.n_tree > self.rebuild_size:
+            self.tree = scipy.spatial.cKDTree(data[:n, self.cols], balanced_tree=False) # see IncrementalIndex.update
+            self.n_tree = n
+            self.touched = []
+            self.is_touched = np.zeros(n, dtype=bool)
+        dists = []
+        idxs = []
+        # Ask the tree for more neighbors until k of them are not stale
+        k_tree = min(k, self.n_tree)
+        while True:
+            d, i = self.tree.query(v, k=k_tree, distance_upper_bound=radius, eps=eps, p=p)
+            d, i = np.atleast_1d(d), np.atleast_1d(i)
+            found = i < self.n_tree
+            found[found] = ~self.is_touched[i[found]]
+            if np.sum(found) >= k or k_tree == self.n_tree or i[-1] == self.n_tree:
+                break
+            k_tree = min(2 * k_tree + k, self.n_tree)
+        dists.append(d[found])
+        idxs.append(i[found])
+        changed = np.append(np.array(self.touched, dtype=int), np.arange(self.n_tree, n))
+        if len(changed) > 0:
+            d = IncrementalIndex.distances(data[changed][:, self.cols], v, p)
+            found = d < radius
+            dists.append(d[found])
+            idxs.append(changed[found])
+        dists = np.concatenate(dists)
+        idxs = np.concatenate(idxs)
+        order = np.lexsort((idxs, dists))[:k]
+        dists = np.append(dists[order], [np.inf] * (k - len(order)))
+        idxs = np.append(idxs[order], [n] * (k - len(order)))
+        return dists, [int(i) for i in idxs]
+
+
+def new_index(cols, leaf_size=1024, grid=None):
+    """
+    Index on the columns cols: a GridIndex if grid=(grid_cols, bounds, n_cells) is given and cols are the grid columns,
+    an IncrementalIndex otherwise.
+    Queries on more columns than the grid ones are left to the kd-trees: the other columns loosen the bound
+    on the distances out of the scanned cells, and the grid then scans many cells.
+    """
+    if grid is not None:
+        col_list = range(cols.start, cols.stop) if isinstance(cols, slice) else list(cols)
+        grid_cols, bounds, n_cells = grid
+        if set(grid_cols) == set(col_list):
+            return GridIndex(col_list, grid_cols, bounds, n_cells)
+    return IncrementalIndex(cols, leaf_size)
+
+
+class GrowableDataset(object):
+    """
+    Dataset of (x, y) points with the interface of explauto's BufferedDataset,
+    stored in one preallocated array of type dtype that doubles its capacity when full.
+    The points are returned as float64, the queries are computed in dtype (kd-trees always work in float64).
+
+    Nearest neighbors queries on x, y, or a subset of their dimensions, use an IncrementalIndex
+    per set of dimensions, so that adding points never rebuilds the trees of all the points,
+    or a GridIndex if grid=(grid_dims, bounds, n_cells) is given and the dimensions are grid_dims (indexes in xy).
+
+    A snapshot shares the array of the points with the dataset until one of them is modified (copy-on-write).
+    """
+    def __init__(self, dim_x, dim_y, leaf_size=1024, capacity=1024, dtype=np.float64, grid=None):
+        self.dim_x = dim_x
+        self.dim_y = dim_y
+        self.leaf_size = leaf_size
+        self.grid = grid
+        self.capacity = capacity
+        self.data = np.zeros((0, dim_x + dim_y), dtype=dtype)
+        self.reset()
+
+    def __getstate__(self):
+        odict = self.__dict__.copy()
+        odict['data'] = self.data[:self.size].copy()
+        del odict['indexes']
+        return odict
+
+    def __setstate__(self, dict):
+        self.__dict__.update(dict)
+        self.indexes = {}
+        self.shared = False
+
+    def reset(self):
+        """Reset the dataset to zero elements."""
+        self.data = np.zeros((self.capacity, self.dim_x + self.dim_y), dtype=self.data.dtype)
+        self.size = 0
+        self.indexes = {}
+        self.shared = False # data is shared with a snapshot
+
+    def snapshot(self):
+        """
+        Copy of the dataset sharing the array of the points and the kd-trees of its indexes:
+        the array is copied by the first of the two datasets that adds or sets a point.
+        """
+        dataset = copy.copy(self)
+        dataset.indexes = dict((key, index.snapshot()) for key, index in self.indexes.iteritems())
+        self.shared = dataset.shared = True
+        return dataset
+
+    def nbytes(self):
+        """
+        Memory of the array of the points (with its free capacity) and of the indexes, in bytes.
+        """
+        return self.data.nbytes + sum([index.nbytes() for index in self.indexes.values()])
+
+    def reserve(self, n):
+        """
+        Make room for n points, doubling the capacity if needed, or copying the points if they are shared.
+        """
+        if n > len(self.data) or self.shared:
+            data = np.zeros((max(n, 2 * len(self.data)) if n > len(self.data) else len(self.data), self.dim_x + self.dim_y), dtype=self.data.dtype)
+            data[:self.size] = self.data[:self.size]
+            self.data = data
+            self.shared = False
+
+    def add_xy(self, x, y=None):
+        assert len(x) == self.dim_x, (len(x), self.dim_x)
+        assert self.dim_y == 0 or len(y) == self.dim_y, (len(y), self.dim_y)
+        self.reserve(self.size + 1)
+        self.data[self.size, :self.dim_x] = x
+        if self.dim_y > 0:
+            self.data[self.size, self.dim_x:] = y
+        self.size += 1
+
+    def add_xy_batch(self, x_list, y_list):
+        assert len(x_list) == len(y_list)
+        n = len(x_list)
+        if n == 0:
+            return
+        self.reserve(self.size + n)
+        self.data[self.size:self.size + n, :self.dim_x] = x_list
+        if self.dim_y > 0:
+            self.data[self.size:self.size + n, self.dim_x:] = y_list
+        self.size += n
+
+    def get_x(self, index):
+        return self.data[index, :self.dim_x].astype(float)
+
+    def set_x(self, x, index):
+        self.reserve(self.size)
+        self.data[index, :self.dim_x] = x
+        self.indexes = {}
+
+    def get_x_padded(self, index):
+        return np.append(1.0, self.data[index, :self.dim_x])
+
+    def get_y(self, index):
+        return self.data[index, self.dim_x:].astype(float)
+
+    def set_y(self, y, index):
+        self.reserve(self.size)
+        self.data[index, self.dim_x:] = y
+        self.indexes = {}
+
+    def get_xy(self, index):
+        return self.get_x(index), self.get_y(index)
+
+    def set_xy(self, x, y, index):
+        self.set_x(x, index)
+        self.set_y(y, index)
+
+    def get_dims(self, index, dims_x=None, dims_y=None, dims=None):
+        if dims is None:
+            return np.hstack((self.data[index, :self.dim_x][dims_x], self.data[index, np.array(dims_y, dtype=int)])).astype(float)
+        else:
+            if max(dims) < self.dim_x or min(dims) > self.dim_x:
+                return self.data[index, dims].astype(float)
+            else:
+                raise NotImplementedError
+
+    def get_x_array(self):
+        """
+        View on the x of all the points, of shape (n, dim_x)
+        """
+        return self.data[:self.size, :self.dim_x]
+
+    def get_y_array(self):
+        """
+        View on the y of all the points, of shape (n, dim_y)
+        """
+        return self.data[:self.size, self.dim_x:]
+
+    def iter_x(self):
+        return iter(self.get_x_array())
+
+    def iter_y(self):
+        return iter(self.get_y_array())
+
+    def iter_xy(self):
+        return zip(self.iter_x(), self.iter_y())
+
+    def __len__(self):
+        return self.size
+
+    def make_index(self, cols):
+        return new_index(cols, self.leaf_size, self.grid)
+
+    def _nn(self, key, cols, v, k=1, radius=np.inf, eps=0.0, p=2):
+        if self.size == 0:
+            return np.array([]), []
+        if key not in self.indexes:
+            self.indexes[key] = self.make_index(cols)
+        return self.indexes[key].query(self.data, self.size, np.array(v, dtype=self.data.dtype), k, radius, eps, p)
+
+    def _nn_batch(self, key, cols, vs, k=1, radius=np.inf, eps=0.0, p=2):
+        # The rows of vs are answered together by kd-trees, even with a grid (whose scans are per query)
+        key = ('batch', key)
+        if key not in self.indexes:
+            self.indexes[key] = IncrementalIndex(cols, self.leaf_size)
+        return self.indexes[key].query_batch(self.data, self.size, np.array(vs, dtype=self.data.dtype), k, radius, eps, p)
+
+    def nn_x(self, x, k=1, radius=np.inf, eps=0.0, p=2):
+        """Find the k nearest neighbors of x in the observed input data
+        @see Databag.nn() for argument description
+        @return  distance and indexes of found nearest neighbors.
+        """
+        assert len(x) == self.dim_x
+        return self._nn('x', slice(0, self.dim_x), x, min(k, self.size), radius, eps, p)
+
+    def nn_y(self, y, dims=None, k=1, radius=np.inf, eps=0.0, p=2):
+        """Find the k nearest neighbors of y in the observed output data,
+        or of y on the output dimensions dims (indexes in y) if given
+        @see Databag.nn() for argument description
+        @return  distance and indexes of found nearest neighbors.
+        """
+        if dims is None:
+            assert len(y) == self.dim_y
+            return self._nn('y', slice(self.dim_x, self.dim_x + self.dim_y), y, min(k, self.size), radius, eps, p)
+        else:
+            return self.nn_y_sub(y, dims, k, radius, eps, p)
+
+    def nn_y_sub(self, y, dims, k=1, radius=np.inf, eps=0.0, p=2):
+        assert len(y) == len(dims)
+        cols = tuple(self.dim_x + d for d in dims)
+        return self._nn(cols, list(cols), y, min(k, self.size), radius, eps, p)
+
+    def nn_y_sub_batch(self, ys, dims, k=1, radius=np.inf, eps=0.0, p=2):
+        """Same as nn_y_sub for each row of ys, in one query: returns arrays of shape (len(ys), k)
+        """
+        assert np.shape(ys)[1] == len(dims) and self.size > 0
+        cols = tuple(self.dim_x + d for d in dims)
+        return self._nn_batch(cols, list(cols), ys, min(k, self.size), radius, eps, p)
+
+    def nn_dims(self, x, y, dims_x, dims_y, k=1, radius=np.inf, eps=0.0, p=2):
+        """Find the k nearest neighbors of a subset of dims of x and y in the observed output data
+        @see Databag.nn() for argument description
+        @return  distance and indexes of found nearest neighbors.
+        """
+        assert len(x) == len(dims_x)
+        assert len(y) == len(dims_y)
+        cols = tuple(dims_x) + tuple(dims_y)
+        return self._nn(cols, list(cols), np.hstack((x, y)), k, radius, eps, p)
+
+
+class BoundedDataset(GrowableDataset):
+    """
+    GrowableDataset of at most capacity points: once full, each new point evicts a point chosen by the retention policy,
+    and takes its index.
+
+    retention:
+    - 'reservoir': reservoir sampling, the points are a uniform sample of all the points added
+    - 'recency': the last capacity points added
+    - 'coverage': spatial thinning, the new point evicts the oldest point of the most crowded cell
+      of a uniform grid of cell size resolution on y
+
+    The queries use SnapshotIndexes, so that their cost does not depend on the number of points added.
+    n_evicted counts the evicted points.
+    """
+    def __init__(self, dim_x, dim_y, capacity, retention='reservoir', resolution=0.1, seed=0, rebuild_size=1024, dtype=np.float64):
+        GrowableDataset.__init__(self, dim_x, dim_y, leaf_size=rebuild_size, capacity=capacity, dtype=dtype)
+        if retention not in ['reservoir', 'recency', 'coverage']:
+            raise NotImplementedError
+        self.retention = retention
+        self.resolution = resolution
+        self.random_state = np.random.RandomState(seed) # own generator, so as not to change the random draws of the experiment
+
+    def reset(self):
+        GrowableDataset.reset(self)
+        self.n_added = 0
+        self.n_evicted = 0
+        self.cells = {} # coverage: cell -> indexes of its points, oldest first
+        self.cell_of_point = {}
+        self.cells_by_size = {} # coverage: size -> cells of that size
+        self.max_cell_size = 0
+
+    def make_index(self, cols):
+        return SnapshotIndex(cols, self.leaf_size)
+
+    def _nn_batch(self, key, cols, vs, k=1, radius=np.inf, eps=0.0, p=2):
+        # The points are replaced in place: one query of the SnapshotIndex per row of vs
+        results = [self._nn(key, cols, v, k, radius, eps, p) for v in vs]
+        return np.array([d for d, _ in results]), np.array([i for _, i in results], dtype=int)
+
+    def snapshot(self):
+        # The points are replaced in place: the snapshot is a copy (its indexes are rebuilt)
+        return copy.deepcopy(self)
+
+    def set_x(self, x, index):
+        self.data[index, :self.dim_x] = x
+        self.indexes = {}
+
+    def set_y(self, y, index):
+        if self.retention == 'coverage':
+            raise NotImplementedError
+        self.data[index, self.dim_x:] = y
+        self.indexes = {}
+
+    def resize_cell(self, cell, delta):
+        size = len(self.cells.get(cell, []))
+        if size > 0:
+            self.cells_by_size[size].discard(cell)
+        if size + delta > 0:
+            self.cells_by_size.setdefault(size + delta, set()).add(cell)
+        self.max_cell_size = max(self.max_cell_size, size + delta)
+        while self.max_cell_size > 0 and len(self.cells_by_size.get(self.max_cell_size, ())) == 0:
+            self.max_cell_size -= 1
+
+    def add_to_cell(self, index, y):
+        cell = tuple(np.floor(np.asarray(y, dtype=float) / self.resolution).astype(int))
+        self.resize_cell(cell, 1)
+        self.cells.setdefault(cell, []).append(index)
+        self.cell_of_point[index] = cell
+
+    def remove_from_cell(self, index):
+        cell = self.cell_of_point.pop(index)
+        self.resize_cell(cell, -1)
+        self.cells[cell].remove(index)
+        if len(self.cells[cell]) == 0:
+            del self.cells[cell]
+
+    def evicted_index(self, y):
+        """
+        Index of the point to evict for a new point y, or None if the new point is not kept.
+        """
+        if self.retention == 'reservoir':
+            i = self.random_state.randint(self.n_added)
+            return i if i < self.capacity else None
+        elif self.retention == 'recency':
+            return self.n_added % self.capacity
+        else:
+            cell = tuple(np.floor(np.asarray(y, dtype=float) / self.resolution).astype(int))
+            if len(self.cells.get(cell, [])) < self.max_cell_size:
+                cell = next(iter(self.cells_by_size[self.max_cell_size]))
+            return self.cells[cell][0]
+
+    def add_xy(self, x, y=None):
+        assert len(x) == self.dim_x, (len(x), self.dim_x)
+        assert self.dim_y == 0 or len(y) == self.dim_y, (len(y), self.dim_y)
+        self.n_added += 1
+        if self.size < self.capacity:
+            index = self.size
+            self.reserve(self.size + 1) # the array is truncated to the points when pickled
+            self.size += 1
+        else:
+            index = self.evicted_index(y)
+            if index is None:
+                return
+            self.n_evicted += 1
+            if self.retention == 'coverage':
+                self.remove_from_cell(index)
+            for idx in self.indexes.values():
+                idx.touch(index)
+        self.data[index, :self.dim_x] = x
+        if self.dim_y > 0:
+            self.data[index, self.dim_x:] = y
+        if self.retention == 'coverage':
+            self.add_to_cell(index, y)
+
+    def add_xy_batch(self, x_list, y_list):
+        assert len(x_list) == len(y_list)
+        for x, y in zip(x_list, y_list):
+            self.add_xy(x, y)
+
+
+class SharedStore(object):
+    """
+    Append-only array of the sensorimotor rows (the ms vectors) observed by the agent,
+    shared by the datasets of several modules (see StoreView), stored with type dtype.
+    A snapshot shares the rows with the store until one of them appends a row (copy-on-write).
+    """
+    def __init__(self, n_dims, capacity=1024, dtype=np.float64):
+        self.n_dims = n_dims
+        self.data = np.zeros((capacity, n_dims), dtype=dtype)
+        self.size = 0
+        self.shared = False # data is shared with a snapshot
+
+    def __getstate__(self):
+        odict = self.__dict__.copy()
+        odict['data'] = self.data[:self.size].copy()
+        return odict
+
+    def __setstate__(self, dict):
+        self.__dict__.update(dict)
+        self.shared = False
+
+    def snapshot(self):
+        store = copy.copy(self)
+        self.shared = store.shared = True
+        return store
+
+    def nbytes(self):
+        return self.data.nbytes
+
+    def reserve(self, n):
+        """
+        Make room for n rows, doubling the capacity if needed, or copying the rows if they are shared.
+        """
+        if n > len(self.data) or self.shared:
+            data = np.zeros((max(n, 2 * len(self.data)) if n > len(self.data) else len(self.data), self.n_dims), dtype=self.data.dtype)
+            data[:self.size] = self.data[:self.size]
+            self.data = data
+            self.shared = False
+
+    def append(self, row):
+        """
+        Append a row and return its index.
+        """
+        assert len(row) == self.n_dims, (len(row), self.n_dims)
+        self.reserve(self.size + 1)
+        self.data[self.size] = row
+        self.size += 1
+        return self.size - 1
+
+    def append_batch(self, rows):
+        """
+        Append the rows of an array of shape (n, n_dims) and return their indexes.
+        """
+        rows = np.atleast_2d(rows)
+        n = len(rows)
+        self.reserve(self.size + n)
+        self.data[self.size:self.size + n] = rows
+        self.size += n
+        return np.arange(self.size - n, self.size)
+
+
+class StoreView(object):
+    """
+    Dataset with the interface of explauto's BufferedDataset whose points are
+    the columns dims_x and dims_y of some rows of a SharedStore.
+
+    The view only keeps the indexes of its rows. A point added with add_xy which is
+    the last row of the store (it was just appended for all the modules) is referenced
+    rather than copied, other points are appended to the store, with nan on the other columns.
+    The rows of the store are shared by the views and cannot be modified.
+    grid=(grid_dims, bounds, n_cells), with grid_dims indexes in xy, selects GridIndexes as in GrowableDataset.
+    """
+    def __init__(self, store, dims_x, dims_y, leaf_size=1024, capacity=1024, grid=None):
+        self.store = store
+        self.dims_x = np.array(dims_x, dtype=int)
+        self.dims_y = np.array(dims_y, dtype=int)
+        self.dims = np.append(self.dims_x, self.dims_y)
+        self.dim_x = len(self.dims_x)
+        self.dim_y = len(self.dims_y)
+        self.leaf_size = leaf_size
+        self.grid = grid
+        if grid is not None:
+            self.grid = (self.dims[list(grid[0])], grid[1], grid[2]) # grid on the columns of the store
+        self.capacity = capacity
+        self.reset()
+
+    def __getstate__(self):
+        odict = self.__dict__.copy()
+        odict['rows'] = self.rows[:self.size].copy()
+        del odict['indexes']
+        return odict
+
+    def __setstate__(self, dict):
+        self.__dict__.update(dict)
+        self.indexes = {}
+        self.shared = False
+
+    def reset(self):
+        """Reset the dataset to zero elements."""
+        self.rows = np.zeros(self.capacity, dtype=int)
+        self.size = 0
+        self.indexes = {}
+        self.shared = False # rows is shared with a snapshot
+
+    def snapshot(self, store):
+        """
+        Copy of the view on store, a snapshot of its store, sharing its rows and the kd-trees of its indexes
+        until one of the two views adds a point (see GrowableDataset.snapshot).
+        """
+        view = copy.copy(self)
+        view.store = store
+        view.indexes = dict((key, index.snapshot()) for key, index in self.indexes.iteritems())
+        self.shared = view.shared = True
+        return view
+
+    def nbytes(self):
+        """
+        Memory of the row numbers of the points and of the nearest neighbors indexes, in bytes (the store is not counted).
+        """
+        return self.rows.nbytes + sum([index.nbytes() for index in self.indexes.values()])
+
+    def reserve(self, n):
+        if n > len(self.rows) or self.shared:
+            rows = np.zeros(max(n, 2 * len(self.rows)) if n > len(self.rows) else len(self.rows), dtype=int)
+            rows[:self.size] = self.rows[:self.size]
+            self.rows = rows
+            self.shared = False
+
+    def add_row(self, index):
+        """
+        Add the row index of the store to the points of the view.
+        """
+        self.reserve(self.size + 1)
+        self.rows[self.size] = index
+        self.size += 1
+
+    def add_rows(self, indexes):
+        n = len(indexes)
+        self.reserve(self.size + n)
+        self.rows[self.size:self.size + n] = indexes
+        self.size += n
+
+    def add_xy(self, x, y=None):
+        assert len(x) == self.dim_x, (len(x), self.dim_x)
+        assert self.dim_y == 0 or len(y) == self.dim_y, (len(y), self.dim_y)
+        xy = np.append(x, y if self.dim_y > 0 else []).astype(self.store.data.dtype)
+        last = self.store.size - 1
+        if last >= 0 and np.array_equal(self.store.data[last, self.dims], xy):
+            self.add_row(last)
+        else:
+            row = np.nan * np.ones(self.store.n_dims)
+            row[self.dims] = xy
+            self.add_row(self.store.append(row))
+
+    def add_xy_batch(self, x_list, y_list):
+        assert len(x_list) == len(y_list)
+        n = len(x_list)
+        if n == 0:
+            return
+        xy = np.hstack((np.reshape(x_list, (n, self.dim_x)), np.reshape(y_list, (n, self.dim_y)))).astype(self.store.data.dtype)
+        start = self.store.size - n
+        if start >= 0 and np.array_equal(self.store.data[start:self.store.size][:, self.dims], xy):
+            self.add_rows(np.arange(start, self.store.size))
+        else:
+            rows = np.nan * np.ones((n, self.store.n_dims))
+            rows[:, self.dims] = xy
+            self.add_rows(self.store.append_batch(rows))
+
+    def get_x(self, index):
+        return self.store.data[self.rows[index], self.dims_x].astype(float)
+
+    def set_x(self, x, index):
+        raise NotImplementedError
+
+    def get_x_padded(self, index):
+        return np.append(1.0, self.get_x(index))
+
+    def get_y(self, index):
+        return self.store.data[self.rows[index], self.dims_y].astype(float)
+
+    def set_y(self, y, index):
+        raise NotImplementedError
+
+    def get_xy(self, index):
+        return self.get_x(index), self.get_y(index)
+
+    def set_xy(self, x, y, index):
+        raise NotImplementedError
+
+    def get_dims(self, index, dims_x=None, dims_y=None, dims=None):
+        if dims is None:
+            return np.hstack((self.get_x(index)[dims_x], self.store.data[self.rows[index], self.dims[np.array(dims_y, dtype=int)]])).astype(float)
+        else:
+            if max(dims) < self.dim_x or min(dims) > self.dim_x:
+                return self.store.data[self.rows[index], self.dims[dims]].astype(float)
+            else:
+                raise NotImplementedError
+
+    def get_x_array(self):
+        """
+        Array of the x of all the points, of shape (n, dim_x)
+        """
+        return self.store.data[self.rows[:self.size]][:, self.dims_x]
+
+    def get_y_array(self):
+        """
+        Array of the y of all the points, of shape (n, dim_y)
+        """
+        return self.store.data[self.rows[:self.size]][:, self.dims_y]
+
+    def get_row_mask(self):
+        """
+        Boolean mask of the rows of the store that are points of the view
+        """
+        mask = np.zeros(self.store.size, dtype=bool)
+        mask[self.rows[:self.size]] = True
+        return mask
+
+    def iter_x(self):
+        return iter(self.get_x_array())
+
+    def iter_y(self):
+        return iter(self.get_y_array())
+
+    def iter_xy(self):
+        return zip(self.iter_x(), self.iter_y())
+
+    def __len__(self):
+        return self.size
+
+    def _nn(self, key, cols, v, k=1, radius=np.inf, eps=0.0, p=2):
+        if self.size == 0:
+            return np.array([]), []
+        if key not in self.indexes:
+            self.indexes[key] = new_index(cols, self.leaf_size, self.grid)
+        return self.indexes[key].query(self.store.data, self.size, np.array(v, dtype=self.store.data.dtype), k, radius, eps, p, rows=self.rows)
+
+    def _nn_batch(self, key, cols, vs, k=1, radius=np.inf, eps=0.0, p=2):
+        # See GrowableDataset._nn_batch
+        key = ('batch', key)
+        if key not in self.indexes:
+            self.indexes[key] = IncrementalIndex(cols, self.leaf_size)
+        return self.indexes[key].query_batch(self.store.data, self.size, np.array(vs, dtype=self.store.data.dtype), k, radius, eps, p, rows=self.rows)
+
+    def nn_x(self, x, k=1, radius=np.inf, eps=0.0, p=2):
+        """Find the k nearest neighbors of x in the observed input data
+        @see Databag.nn() for argument description
+        @return  distance and indexes of found nearest neighbors.
+        """
+        assert len(x) == self.dim_x
+        return self._nn('x', self.dims_x, x, min(k, self.size), radius, eps, p)
+
+    def nn_y(self, y, dims=None, k=1, radius=np.inf, eps=0.0, p=2):
+        """Find the k nearest neighbors of y in the observed output data,
+        or of y on the output dimensions dims (indexes in y) if given
+        @see Databag.nn() for argument description
+        @return  distance and indexes of found nearest neighbors.
+        """
+        if dims is None:
+            assert len(y) == self.dim_y
+            return self._nn('y', self.dims_y, y, min(k, self.size), radius, eps, p)
+        else:
+            return self.nn_y_sub(y, dims, k, radius, eps, p)
+
+    def nn_y_sub(self, y, dims, k=1, radius=np.inf, eps=0.0, p=2):
+        assert len(y) == len(dims)
+        return self._nn(tuple(self.dim_x + d for d in dims), self.dims_y[list(dims)], y, min(k, self.size), radius, eps, p)
+
+    def nn_y_sub_batch(self, ys, dims, k=1, radius=np.inf, eps=0.0, p=2):
+        # See GrowableDataset.nn_y_sub_batch
+        assert np.shape(ys)[1] == len(dims) and self.size > 0
+        return self._nn_batch(tuple(self.dim_x + d for d in dims), self.dims_y[list(dims)], ys, min(k, self.size), radius, eps, p)
+
+    def nn_dims(self, x, y, dims_x, dims_y, k=1, radius=np.inf, eps=0.0, p=2):
+        """Find the k nearest neighbors of a subset of dims of x and y in the observed output data
+        @see Databag.nn() for argument description
+        @return  distance and indexes of found nearest neighbors.
+        """
+        assert len(x) == len(dims_x)
+        assert len(y) == len(dims_y)
+        cols = tuple(dims_x) + tuple(dims_y)
+        return self._nn(cols, self.dims[list(cols)], np.hstack((x, y)), k, radius, eps, p)
+
+
+class NoveltyFilter(object):
+    """
+    Count the points falling in each cell of a uniform grid of cell size resolution,
+    to keep only one representative point per cell, with the number of points of its cell.
+    """
+    def __init__(self, resolution):
+        self.resolution = resolution
+        self.counts = {} # cell -> number of points seen in the cell
+        self.representatives = {} # id of the representative point of a cell (e.g. its index in a dataset) -> cell
+
+    def cell_of(self, x):
+        return tuple(np.floor(np.asarray(x) / self.resolution).astype(int))
+
+    def add(self, x, representative=None):
+        """
+        Count x in its cell, return True if it is the first point of the cell,
+        which is then the representative point of the cell, with id representative.
+        """
+        cell = self.cell_of(x)
+        count = self.counts.get(cell, 0)
+        self.counts[cell] = count + 1
+        if count == 0 and representative is not None:
+            self.representatives[representative] = cell
+        return count == 0
+
+    def add_batch(self, x_array):
+        """
+        Count the points of x_array, of shape (n, len(x)), in their cells in order,
+        return the boolean mask of the points that were the first of their cell (see set_representative).
+        """
+        cells = np.floor(np.asarray(x_array) / self.resolution).astype(int)
+        first = np.zeros(len(cells), dtype=bool)
+        for i, cell in enumerate(map(tuple, cells)):
+            count = self.counts.get(cell, 0)
+            self.counts[cell] = count + 1
+            first[i] = (count == 0)
+        return first
+
+    def set_representative(self, x, representative):
+        """
+        Give the id representative to the representative point of the cell of x
+        """
+        self.representatives[representative] = self.cell_of(x)
+
+    def count(self, representative):
+        """
+        Number of points of the cell of the representative point with id representative (1 for other ids)
+        """
+        if representative in self.representatives:
+            return self.counts[self.representatives[representative]]
+        return 1
+
+    def __len__(self):
+        """Number of cells with at least one point"""
+        return len(self.counts)
+
+    def n_filtered(self):
+        """Number of points that were not the first of their cell"""
+        return sum(self.counts.values()) - len(self.counts)
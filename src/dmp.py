@@ -1,9 +1,105 @@
-from numpy import zeros, ones, array
+from numpy import zeros, ones, array, tile, concatenate, einsum, swapaxes, where, allclose, errstate
+from numpy.linalg import lstsq
+from numpy.random import RandomState
 from copy import copy
 
 from pydmps.dmp_rhythmic import DMPs_rhythmic
 from pydmps.dmp_discrete import DMPs_discrete
 
+
+def discrete_dmp_features(y0, goal, w):
+    """ Features (y0, goal, w, (goal - y0) * w) of discrete DMPs, of shape (..., dmps, 2 * bfs + 2)
+    for y0 and goal of shape (..., dmps) and w of shape (..., dmps, bfs)
+    """
+    return concatenate((y0[..., None], goal[..., None], w, (goal - y0)[..., None] * w), axis=-1)
+
+discrete_dmp_maps = {}
+
+def discrete_dmp_map(dmps, bfs, timesteps):
+    """ Linear map from the features (see discrete_dmp_features) of a discrete DMP to its trajectory.
+    
+    With fixed timesteps and tau, the rollout is linear in y0, goal and in the forcing term, 
+    which pydmps scales by (goal - y0) or not depending on its version: the map covers both. 
+    It is fitted once per (dmps, bfs, timesteps) by least squares on pydmps rollouts 
+    of random y0, goal and w, and has shape (timesteps, dmps, 2 * bfs + 2).
+    """
+    key = (dmps, bfs, timesteps)
+    if key not in discrete_dmp_maps:
+        dmp = DMPs_discrete(dmps=dmps, bfs=bfs, dt=2./timesteps)
+        rng = RandomState(0)
+        n_features = 2 * bfs + 2
+        n = 2 * n_features
+        y0 = rng.uniform(-1., 1., (n, dmps))
+        goal = rng.uniform(-1., 1., (n, dmps))
+        w = rng.uniform(-1., 1., (n, dmps, bfs))
+        y = []
+        for i in range(n):
+            dmp.y0 = y0[i].copy()
+            dmp.goal = goal[i].copy()
+            dmp.w = w[i].copy()
+            y.append(dmp.rollout(timesteps=timesteps, tau=1.)[0])
+        y = array(y)
+        features = discrete_dmp_features(y0, goal, w)
+        dmp_map = zeros((timesteps, dmps, n_features))
+        for d in range(dmps):
+            dmp_map[:, d, :] = lstsq(features[:, d, :], y[:, :, d], rcond=None)[0].T
+        discrete_dmp_maps[key] = dmp_map
+    return discrete_dmp_maps[key]
+
+discrete_dmp_imitations = {}
+
+def discrete_dmp_imitation(dmps, bfs, timesteps, n_samples):
+    """ Linear projections giving the weights fitted by pydmps imitate_path to a path of n_samples points,
+    or None if they do not match imitate_path.
+    
+    Whether pydmps scales the forcing term by (goal - y0) or not, the weights are linear 
+    in the features (y, y / (goal - y0)) of a path y from y0 to goal, and in (y, 1) when goal == y0 
+    (pydmps then offsets the goal). Returns the projections of these features, of shapes 
+    (dmps, bfs, 2 * n_samples) and (dmps, bfs, n_samples + 1), fitted once per (dmps, bfs, timesteps, n_samples) 
+    by least squares on pydmps fits of random paths and checked against other fits.
+    """
+    key = (dmps, bfs, timesteps, n_samples)
+    if key not in discrete_dmp_imitations:
+        dmp = DMPs_discrete(dmps=dmps, bfs=bfs, dt=2./timesteps)
+        rng = RandomState(0)
+        def random_paths(n, flat):
+            # Paths of shape (n, dmps, n_samples), with |goal - y0| >= 0.5 or goal == y0
+            y = rng.uniform(-1., 1., (n, dmps, n_samples))
+            if flat:
+                y[..., -1] = y[..., 0]
+            else:
+                y[..., -1] = y[..., 0] + rng.choice([-1., 1.], (n, dmps)) * rng.uniform(0.5, 1., (n, dmps))
+            return y
+        def imitate(y):
+            w = []
+            for yi in y:
+                dmp.imitate_path(yi.copy())
+                w.append(dmp.w.copy())
+            return array(w)
+        projections = []
+        for flat, n_features in [(False, 2 * n_samples), (True, n_samples + 1)]:
+            y = random_paths(2 * n_features, flat)
+            features = discrete_dmp_imitation_features(y, flat)
+            w = imitate(y)
+            projection = zeros((dmps, bfs, n_features))
+            for d in range(dmps):
+                projection[d] = lstsq(features[:, d, :], w[:, d, :], rcond=None)[0].T
+            y = random_paths(5, flat)
+            if not allclose(einsum('dbj,ndj->ndb', projection, discrete_dmp_imitation_features(y, flat)), imitate(y), rtol=1e-9, atol=1e-9):
+                projections = None
+                break
+            projections.append(projection)
+        discrete_dmp_imitations[key] = projections
+    return discrete_dmp_imitations[key]
+
+def discrete_dmp_imitation_features(y, flat):
+    """ Features (y, y / (goal - y0)), or (y, 1) if flat, of paths y of shape (..., dmps, n_samples) 
+    """
+    if flat:
+        return concatenate((y, ones(y.shape[:-1] + (1,))), axis=-1)
+    return concatenate((y, y / (y[..., -1:] - y[..., :1])), axis=-1)
+
+
 class MotorPrimitive(object):
     def __init__(self, conf):
         pass
@@ -22,15 +118,47 @@ class DmpPrimitive(object):
         
         if type == 'discrete':
             self.dmp = DMPs_discrete(dmps=dmps, bfs=bfs, dt=2./timesteps)
+            self.map = discrete_dmp_map(dmps, bfs, timesteps)
+            if not self.check_map():
+                self.map = None
         elif type =='rythmic':
             #dt = 6.28 / timesteps
             self.dmp = DMPs_rhythmic(dmps=dmps, bfs=bfs)#, dt=dt)
+            self.map = None
         else:
             raise ValueError('Invalid type specified. Valid choices \
                                  are discrete or rhythmic.')
         #self.dmp.cs.run_time *= run_time
         #self.dmp.timesteps *= run_time
+        
+    def check_map(self):
+        """ True if the trajectories given by the map match the rollouts of pydmps for random parameters
+        """
+        m = RandomState(0).uniform(-1., 1., (5, sum(self.used)))
+        motor = copy(self.motor)
+        y_rollout = array([self.rollout(mi) for mi in m])
+        self.motor = motor
+        return allclose(self.trajectory(m), y_rollout, rtol=1e-9, atol=1e-9)
+    
     def trajectory(self, m, n_times=1):
+        """ Trajectory of shape (timesteps, n_dmps) for parameters m, 
+        or (n, timesteps, n_dmps) for a batch of parameters of shape (n, n_used)
+        """
+        if self.map is None or n_times != 1:
+            if len(array(m).shape) > 1:
+                return array([self.rollout(mi, n_times) for mi in m])
+            return self.rollout(m, n_times)
+        m = array(m)
+        motor = tile(self.default, m.shape[:-1] + (1,))
+        motor[..., self.used] = m
+        y0 = motor[..., :self.n_dmps]
+        goal = motor[..., -self.n_dmps:]
+        w = motor[..., self.n_dmps:-self.n_dmps].reshape(motor.shape[:-1] + (self.n_dmps, self.n_bfs))
+        return einsum('tdk,...dk->...td', self.map, discrete_dmp_features(y0, goal, w))
+    
+    def rollout(self, m, n_times=1):
+        """ Trajectory computed step by step by pydmps
+        """
         #print "trajectory. n_dmps :", self.n_dmps, 'n_bfs', self.n_bfs, 'run time', self.dmp.cs.run_time, 'time steps', self.dmp.timesteps
         self.dmp.cs.run_time *= n_times
         self.dmp.timesteps *= n_times
@@ -42,3 +170,25 @@ class DmpPrimitive(object):
         self.dmp.cs.run_time /= n_times
         self.dmp.timesteps /= n_times
         return y
+    
+    def imitate_weights(self, y):
+        """ Weights of shape (n_dmps, n_bfs) fitted by imitation of a path y of shape (n_samples, n_dmps),
+        or (n, n_dmps, n_bfs) for a batch of paths of shape (n, n_samples, n_dmps)
+        """
+        y = swapaxes(array(y, dtype=float), -1, -2)
+        projections = discrete_dmp_imitation(self.n_dmps, self.n_bfs, self.timesteps, y.shape[-1])
+        if projections is None:
+            if y.ndim > 2:
+                return array([self.imitate_path(yi) for yi in y])
+            return self.imitate_path(y)
+        flat = (y[..., -1] == y[..., 0])[..., None]
+        with errstate(divide='ignore', invalid='ignore'):
+            w = einsum('dbj,...dj->...db', projections[0], discrete_dmp_imitation_features(y, False))
+        w_flat = einsum('dbj,...dj->...db', projections[1], discrete_dmp_imitation_features(y, True))
+        return where(flat, w_flat, w)
+    
+    def imitate_path(self, y):
+        """ Weights fitted by pydmps to a path y of shape (n_dmps, n_samples)
+        """
+        self.dmp.imitate_path(y)
+        return self.dmp.w.copy()
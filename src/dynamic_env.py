@@ -3,6 +3,7 @@ import matplotlib.pyplot as plt
 import matplotlib
 
 from dmp import DmpPrimitive
+from viewer import LiveViewer
 from explauto.utils.utils import bounds_min_max
 from explauto.environment.environment import Environment
 
@@ -32,7 +33,11 @@ class DynamicEnvironment(Environment):
         self.optim_end_position = optim_end_position
         self.gui = gui
         self.n_mvt = 1
-        if self.gui:
+        self.viewer = None
+        if self.gui == "live":
+            # Plot in a separate process, without blocking the experiment
+            self.viewer = LiveViewer(self.env, self.move_steps)
+        elif self.gui:
             plt.ion()
             self.ax = plt.subplot()
             plt.gcf().set_size_inches(12., 12., forward=True)
@@ -57,6 +62,14 @@ class DynamicEnvironment(Environment):
             
     def reset(self):
         self.env.reset()
+
+    def close(self):
+        """
+        Stop the rendering process of the live viewer, if any.
+        """
+        if self.viewer is not None:
+            self.viewer.close()
+            self.viewer = None
             
     def init_motor_DMP(self, optim_initial_position=True, optim_end_position=True, default_motor_initial_position=None, default_motor_end_position=None):
         default = np.zeros(self.n_dynamic_motor_dims * (self.n_bfs + 2))
@@ -101,38 +114,68 @@ class DynamicEnvironment(Environment):
     def compute_motor_command(self, m_ag):  
         m_ag = bounds_min_max(m_ag, self.conf.m_mins, self.conf.m_maxs)
         if self.motor_traj_type == "DMP":
-            dyn_idx = range(self.n_dynamic_motor_dims * self.n_motor_traj_points)
-            #print "m params", m_ag[dyn_idx] * self.max_params
-            m_dyn = self.motor_dmp.trajectory(m_ag[dyn_idx] * self.max_params)
+            n_dyn = self.n_dynamic_motor_dims * self.n_motor_traj_points
+            #print "m params", m_ag[:n_dyn] * self.max_params
+            m_dyn = self.motor_dmp.trajectory(m_ag[:n_dyn] * self.max_params)
             #print "mov", m_dyn
-            static_idx = range(self.n_dynamic_motor_dims * self.n_motor_traj_points, self.conf.m_ndims)
-            m_static = m_ag[static_idx]
-            m = [list(m_dyn_param) + list(m_static) for m_dyn_param in list(m_dyn)]
+            m_static = m_ag[n_dyn:]
+            if len(m_static) == 0:
+                m = m_dyn
+            else:
+                m = np.hstack((m_dyn, np.broadcast_to(m_static, (len(m_dyn), len(m_static)))))
+        else:
+            raise NotImplementedError
+        return m
+    
+    def compute_motor_command_batch(self, m_ags):
+        """ Motor trajectories of n motor commands, in an array of shape (n, move_steps, n_motor_dims)
+        """
+        m_ags = bounds_min_max(np.array(m_ags), self.conf.m_mins, self.conf.m_maxs)
+        if self.motor_traj_type == "DMP":
+            n_dyn = self.n_dynamic_motor_dims * self.n_motor_traj_points
+            m_dyn = self.motor_dmp.trajectory(m_ags[:, :n_dyn] * self.max_params)
+            m_static = np.repeat(m_ags[:, None, n_dyn:], self.move_steps, axis=1)
+            m = np.concatenate((m_dyn, m_static), axis=2)
         else:
             raise NotImplementedError
         return m
     
+    def compute_sensori_params_batch(self, s_traj):
+        """ Sensory parameters of n sensory trajectories of shape (n, move_steps, n_sensori_dims)
+        """
+        y = np.array(s_traj)[:, :self.move_steps, :]
+        if self.sensori_traj_type == "DMP":
+            s = self.sensori_dmp.imitate_weights(y).reshape((len(y), -1))
+        elif self.sensori_traj_type == "samples":
+            s = np.transpose(y[:, self.samples, :], (0, 2, 1)).reshape((len(y), -1))
+        else:
+            raise NotImplementedError
+        return bounds_min_max(s, self.conf.s_mins, self.conf.s_maxs)
+    
+    def compute_sensori_traj(self, m_traj):
+        """ Sensory trajectory of the environment for the motor trajectory m_traj
+        """
+        return self.env.update(m_traj, reset=False, log=False)
+    
     def compute_sensori_effect(self, m_traj):
-        s = self.env.update(m_traj, reset=False, log=False)
-        self.s_traj = s
-        y = np.array(s[:self.move_steps])
+        self.s_traj = np.asarray(self.compute_sensori_traj(m_traj))
+        y = self.s_traj[:self.move_steps]
         if self.sensori_traj_type == "DMP":
-            self.sensori_dmp.dmp.imitate_path(np.transpose(y))
-            w = self.sensori_dmp.dmp.w.flatten()
-            s_ag = list(w)    
+            s = self.sensori_dmp.imitate_weights(y).ravel()
         elif self.sensori_traj_type == "samples":
-            w = y[self.samples,:]
-            s_ag = list(np.transpose(w).flatten())
+            s = y[self.samples].T.ravel()
         else:
             raise NotImplementedError  
-        s = s_ag
         if self.gui:
             #if abs(s[11] - (-0.85)) > 0.1: #Tool1
             #if s[-2] > 0: # One of the boxes
             #if abs(s[-1] - 0.8) > 0.01:
             #if np.random.rand() < 0.001:
             #if abs(s[-1] - s[-3]) > 0.01:
-            self.plot()
+            if self.viewer is not None:
+                self.viewer.show()
+            else:
+                self.plot()
             #print 'dyn env s', s
         return bounds_min_max(s, self.conf.s_mins, self.conf.s_maxs)    
         
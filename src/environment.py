@@ -1,11 +1,15 @@
 import numpy as np
 import matplotlib
+
+from collections import deque
 import matplotlib.pyplot as plt
 
 #matplotlib.use('QT4Agg')
 
 from combined_env import CombinedEnvironment, HierarchicallyCombinedEnvironment
 from dynamic_env import DynamicEnvironment
+from cache import LRUCache
+from outcomes import outcome_codes, tool_used
 
 
 from explauto.utils import bounds_min_max
@@ -24,22 +28,44 @@ colors_config = {
                  "scratch":colors[4],
                  }
 
+def sq_dist(a, b):
+    """ Squared distance between 2D points along the last axis
+    """
+    return (a[..., 0] - b[..., 0]) ** 2 + (a[..., 1] - b[..., 1]) ** 2
+
+
+def new_logs(log_size):
+    """ Per-step logs of an environment component: unbounded list if log_size is None, 
+    else ring buffer of the last log_size steps (log_size=0: no logs)
+    """
+    if log_size is None:
+        return []
+    return deque(maxlen=log_size)
+
+
+def first_true(cond):
+    """ Index of the first True along the last axis, or its length if there is none
+    """
+    return np.where(np.any(cond, axis=-1), np.argmax(cond, axis=-1), cond.shape[-1])
+
+
 class ArmEnvironment(Environment):
     use_process = True
 
     def __init__(self, m_mins, m_maxs, s_mins, s_maxs,
-                 lengths, angle_shift, rest_state):
+                 lengths, angle_shift, rest_state, log_size=None):
         
         Environment.__init__(self, m_mins, m_maxs, s_mins, s_maxs)
 
         self.lengths = lengths
         self.angle_shift = angle_shift
         self.rest_state = rest_state
+        self.log_size = log_size
         self.reset()
         
     def reset(self):
         #print "reset gripper"
-        self.logs = []
+        self.logs = new_logs(self.log_size)
         
     def compute_motor_command(self, m):
         return bounds_min_max(m, self.conf.m_mins, self.conf.m_maxs)
@@ -50,9 +76,37 @@ class ArmEnvironment(Environment):
         a_pi = np.pi * a 
         hand_pos = np.array([np.sum(np.cos(a_pi)*self.lengths), np.sum(np.sin(a_pi)*self.lengths)])
         angle = np.mod(a[-1] + 1, 2) - 1
-        self.logs.append(m)
+        if self.log_size != 0:
+            self.logs.append(m)
         return [hand_pos[0], hand_pos[1], angle]
     
+    def compute_sensori_effect_batch(self, m):
+        """ Compute hand position and angle for an array of joint positions of shape (..., 3)
+        """
+        a = self.angle_shift + np.cumsum(m, axis=-1)
+        a_pi = np.pi * a
+        hand_x = np.sum(np.cos(a_pi)*self.lengths, axis=-1)
+        hand_y = np.sum(np.sin(a_pi)*self.lengths, axis=-1)
+        angle = np.mod(a[..., -1] + 1, 2) - 1
+        return np.stack((hand_x, hand_y, angle), axis=-1)
+    
+    def update(self, m, reset=True, log=True):
+        """ A joint trajectory of shape (T, 3) is computed in one pass
+        """
+        if len(np.array(m).shape) == 1:
+            return Environment.update(self, m, reset, log)
+        if reset:
+            self.reset()
+        m_traj = self.compute_motor_command(np.asarray(m, dtype=float))
+        s_traj = self.compute_sensori_effect_batch(m_traj)
+        if self.log_size != 0:
+            self.logs.extend(m_traj)
+        if log:
+            for m_t, s_t in zip(m_traj, s_traj):
+                self.emit('motor', m_t)
+                self.emit('sensori', list(s_t))
+        return s_traj
+    
     
     def plot(self, ax, i, **kwargs_plot):
         m = self.logs[i]
@@ -71,7 +125,7 @@ class ArmEnvironment(Environment):
        
 class Stick(Environment):
     def __init__(self, m_mins, m_maxs, s_mins, s_maxs,
-                 length, type, handle_tol, handle_noise, rest_state):
+                 length, type, handle_tol, handle_noise, rest_state, log_size=None):
         
         Environment.__init__(self, m_mins, m_maxs, s_mins, s_maxs)
 
@@ -81,6 +135,7 @@ class Stick(Environment):
         self.handle_tol_sq = handle_tol * handle_tol
         self.handle_noise = handle_noise
         self.rest_state = rest_state
+        self.log_size = log_size
         
         self.reset()
 
@@ -91,7 +146,7 @@ class Stick(Environment):
         self.handle_pos = np.array(self.rest_state[0:2])
         self.angle = self.rest_state[2]
         self.compute_end_pos()
-        self.logs = []
+        self.logs = new_logs(self.log_size)
         
     def compute_end_pos(self):
         a = np.pi * self.angle
@@ -118,13 +173,61 @@ class Stick(Environment):
             self.compute_end_pos()
         
         #print "Stick log added"
-        self.logs.append([self.handle_pos, 
-                          self.angle, 
-                          self.end_pos, 
-                          self.held])
+        if self.log_size != 0:
+            self.logs.append([self.handle_pos, 
+                              self.angle, 
+                              self.end_pos, 
+                              self.held])
         #print "Tool hand_pos:", hand_pos, "hand_angle:", hand_angle, "gripper_change:", gripper_change, "self.handle_pos:", self.handle_pos, "self.angle:", self.angle, "self.held:", self.held 
         return list(self.end_pos) # Tool pos
     
+    def compute_sensori_traj(self, m, held, handle_pos, angle):
+        """ Compute the stick state along hand trajectories of shape (..., T, 3), 
+        starting from the given held, handle_pos and angle states.
+        Returns the held, handle_pos, angle and end_pos trajectories.
+        """
+        hand_pos = m[..., 0:2]
+        hand_angle = m[..., 2]
+        handle_pos = np.array(handle_pos, dtype=float)[..., None, :]
+        angle = np.array(angle, dtype=float)[..., None]
+        close = sq_dist(hand_pos, handle_pos) < self.handle_tol_sq
+        held = np.array(held)[..., None] | (np.cumsum(close, axis=-1) > 0)
+        # One randn draw per held step, in the same order as the step by step simulation
+        noise = np.zeros(held.shape)
+        noise[held] = np.random.randn(np.sum(held))
+        angle = np.where(held, np.mod(hand_angle + self.handle_noise * noise + 1, 2) - 1, angle)
+        handle_pos = np.where(held[..., None], hand_pos, handle_pos)
+        a = np.pi * angle
+        end_pos = np.stack((handle_pos[..., 0] + np.cos(a) * self.length,
+                            handle_pos[..., 1] + np.sin(a) * self.length), axis=-1)
+        return held, handle_pos, angle, end_pos
+    
+    def compute_sensori_effect_batch(self, m):
+        """ Compute tool end positions for hand trajectories of shape (n, T, 3), each starting with the stick at rest
+        """
+        return self.compute_sensori_traj(m, False, self.rest_state[0:2], self.rest_state[2])[3]
+    
+    def update(self, m, reset=True, log=True):
+        """ A hand trajectory of shape (T, 3) is computed in one pass
+        """
+        if len(np.array(m).shape) == 1:
+            return Environment.update(self, m, reset, log)
+        if reset:
+            self.reset()
+        m_traj = np.asarray(m, dtype=float)
+        held, handle_pos, angle, end_pos = self.compute_sensori_traj(m_traj, self.held, self.handle_pos, self.angle)
+        self.held = bool(held[-1])
+        self.handle_pos = handle_pos[-1]
+        self.angle = angle[-1]
+        self.end_pos = list(end_pos[-1])
+        if self.log_size != 0:
+            self.logs.extend([[handle_pos[t], angle[t], list(end_pos[t]), held[t]] for t in range(len(m_traj))])
+        if log:
+            for m_t, s_t in zip(m_traj, end_pos):
+                self.emit('motor', m_t)
+                self.emit('sensori', list(s_t))
+        return end_pos
+    
     def plot(self, ax, i, **kwargs_plot):
         handle_pos = self.logs[i][0]
         end_pos = self.logs[i][2]
@@ -141,13 +244,14 @@ class Stick(Environment):
 
 class Object(Environment):
     def __init__(self, m_mins, m_maxs, s_mins, s_maxs,
-                 object_tol_hand, object_tol_tool, bounds):
+                 object_tol_hand, object_tol_tool, bounds, log_size=None):
         
         Environment.__init__(self, m_mins, m_maxs, s_mins, s_maxs)
 
         self.object_tol_hand_sq = object_tol_hand * object_tol_hand
         self.object_tol_tool_sq = object_tol_tool * object_tol_tool
         self.bounds = bounds
+        self.log_size = log_size
         self.reset()
         
         
@@ -155,7 +259,7 @@ class Object(Environment):
         #print "reset object"
         self.move = 0
         self.pos = rand_bounds(self.bounds)[0]
-        self.logs = []
+        self.logs = new_logs(self.log_size)
         
     def compute_motor_command(self, m):
         #return bounds_min_max(m, self.conf.m_mins, self.conf.m_maxs)
@@ -172,21 +276,93 @@ class Object(Environment):
 #             self.pos = m[5:7]
 #             self.move = 3
             #print "object moved by tool2"
-        self.logs.append([self.pos,
-                          self.move])
+        if self.log_size != 0:
+            self.logs.append([self.pos,
+                              self.move])
         return list(self.pos)
     
+    def compute_sensori_traj(self, m, pos, move):
+        """ Compute the object state along hand and tool trajectories of shape (..., T, 4), 
+        starting from the given pos and move states.
+        Returns the pos and move trajectories.
+        """
+        hand_pos = m[..., 0:2]
+        tool_pos = m[..., 2:4]
+        pos = np.array(pos, dtype=float)[..., None, :]
+        move = np.array(move)
+        steps = np.arange(m.shape[-2])
+        tool_at_rest = np.abs(m[..., 2] + 0.96213203) < 0.0001
+        # Still object: first step where the hand (tool at rest) or the tool catches it
+        t_hand = first_true(tool_at_rest & (sq_dist(hand_pos, pos) < self.object_tol_hand_sq))
+        t_tool = first_true(sq_dist(tool_pos, pos) < self.object_tol_tool_sq)
+        t_hand = np.where(move == 1, 0, t_hand)
+        t_tool = np.where(move == 2, 0, t_tool)
+        # The hand has priority if both catch the object at the same step
+        by_hand = t_hand <= t_tool
+        # Object following the tool: the hand can still catch it at the tool's previous position
+        prev_pos = np.concatenate((pos, tool_pos[..., :-1, :]), axis=-2)
+        t_hand_after_tool = first_true(tool_at_rest & (sq_dist(hand_pos, prev_pos) < self.object_tol_hand_sq) & (steps > t_tool[..., None]))
+        t_hand = np.where(by_hand, t_hand, t_hand_after_tool)
+        t_tool = np.where(by_hand, len(steps), t_tool)
+        moved_by_hand = steps >= t_hand[..., None]
+        moved_by_tool = (steps >= t_tool[..., None]) & (~ moved_by_hand)
+        pos = np.where(moved_by_hand[..., None], hand_pos, np.where(moved_by_tool[..., None], tool_pos, pos))
+        move = np.where(moved_by_hand, 1, np.where(moved_by_tool, 2, move[..., None]))
+        return pos, move
+    
+    def compute_sensori_effect_batch(self, m, pos):
+        """ Compute object positions for hand and tool trajectories of shape (n, T, 4), 
+        the object of each trajectory starting still at pos[i]
+        """
+        return self.compute_sensori_traj(m, pos, 0)[0]
+    
+    def update(self, m, reset=True, log=True):
+        """ A hand and tool trajectory of shape (T, 4) is computed in one pass
+        """
+        if len(np.array(m).shape) == 1:
+            return Environment.update(self, m, reset, log)
+        if reset:
+            self.reset()
+        m_traj = np.asarray(m, dtype=float)
+        pos, move = self.compute_sensori_traj(m_traj, self.pos, self.move)
+        self.pos = pos[-1]
+        self.move = int(move[-1])
+        if self.log_size != 0:
+            self.logs.extend([[pos[t], move[t]] for t in range(len(m_traj))])
+        if log:
+            for m_t, s_t in zip(m_traj, pos):
+                self.emit('motor', m_t)
+                self.emit('sensori', list(s_t))
+        return pos
+    
     def plot(self, ax, i, **kwargs_plot):
-        self.logs = self.logs[-50:]
-        pos = self.logs[i][0]        
+        pos = list(self.logs)[-50:][i][0]        
         rectangle = plt.Rectangle((pos[0] - 0.05, pos[1] - 0.05), 0.1, 0.1, **kwargs_plot)
         ax.add_patch(rectangle) 
 
 
 
 class ICDL2016Environment(DynamicEnvironment):
-    def __init__(self, move_steps=50, max_params=None, noise=0, gui=False):
+    def __init__(self, move_steps=50, max_params=None, noise=0, gui=False, rollout_cache_size=0, log_size=None):
+        """
+        :param int noise: 0 for a deterministic environment, 1 for a noisy angle of the stick in the hand, 
+        2 for a uniform noise on the sensory trajectory. With noise 2, the movements are computed step by step 
+        as the sensory noise of each step is drawn after the noise of the stick (see compute_sensori_traj).
+        :param gui: True to plot each movement, "live" to plot them in a separate process (see viewer.LiveViewer)
+        :param int log_size: number of steps logged by the arm, stick and object for plotting, 
+        0 to disable the logs. By default, the last movement is kept if gui is set, else nothing is logged.
+        """
 
+        self.noise = noise
+        if rollout_cache_size > 0:
+            if noise != 0:
+                raise ValueError('The rollout cache needs a deterministic arm and stick (noise=0)')
+            self.rollout_cache = LRUCache(rollout_cache_size)
+        else:
+            self.rollout_cache = None
+        self.lower_traj = None
+        if log_size is None:
+            log_size = move_steps if gui else 0
             
         arm_cfg = dict(m_mins=[-1, -1, -1],  # joints pos
                              m_maxs=[1, 1, 1], 
@@ -194,7 +370,8 @@ class ICDL2016Environment(DynamicEnvironment):
                              s_maxs=[1, 1, 1], 
                              lengths=[0.5, 0.3, 0.2], 
                              angle_shift=0.5,
-                             rest_state=[0., 0., 0.])
+                             rest_state=[0., 0., 0.],
+                             log_size=log_size)
         
         
         stick1_cfg = dict(m_mins=[-1, -1, -1], 
@@ -205,7 +382,8 @@ class ICDL2016Environment(DynamicEnvironment):
                          type="1",
                          handle_tol=0.1, 
                          handle_noise=0.1 if noise == 1 else 0., 
-                         rest_state=[-0.75, 0.25, 0.75])
+                         rest_state=[-0.75, 0.25, 0.75],
+                         log_size=log_size)
         
 #         stick2_cfg = dict(m_mins=[-1, -1, -1, -1, -1], 
 #                          m_maxs=[1, 1, 1, 1, 1], 
@@ -235,7 +413,7 @@ class ICDL2016Environment(DynamicEnvironment):
                              lower_env_cfg=arm_cfg, 
                              fun_m_lower= lambda m:m,
                              fun_s_lower=lambda m,s:s,  # (hand pos + hand angle) * 2 tools
-                             fun_s_top=lambda m,s_lower,s:s_lower[0:2] + s) # from s: Tool1 end pos  from m: hand_pos
+                             fun_s_top=lambda m,s_lower,s:np.concatenate((s_lower[..., 0:2], s), axis=-1)) # from s: Tool1 end pos  from m: hand_pos
         
         
         
@@ -246,11 +424,12 @@ class ICDL2016Environment(DynamicEnvironment):
                           object_tol_hand = 0.2, 
                           object_tol_tool = 0.1,
                           bounds = np.array([[-0.5, -0.5],
-                                                 [0.5, 0.5]]))
+                                                 [0.5, 0.5]]),
+                          log_size = log_size)
         
         
         def sensory_noise(s):
-            return np.random.random(len(s)) * 0.1 + np.array(s)
+            return np.random.random(s.shape) * 0.1 + s
         
         
         arm_sticks_object_cfg = dict(
@@ -264,7 +443,7 @@ class ICDL2016Environment(DynamicEnvironment):
                                    lower_env_cfg=arm_stick_cfg, 
                                    fun_m_lower= lambda m:m,
                                    fun_s_lower=lambda m,s:s,
-                                   fun_s_top=lambda m,s_lower,s: sensory_noise(s_lower + s) if noise == 2 else s_lower + s)
+                                   fun_s_top=lambda m,s_lower,s: sensory_noise(np.concatenate((s_lower, s), axis=-1)) if noise == 2 else np.concatenate((s_lower, s), axis=-1))
         
         
         denv_cfg = dict(env_cfg=arm_sticks_object_cfg,
@@ -298,6 +477,53 @@ class ICDL2016Environment(DynamicEnvironment):
     def current_context(self):
         return self.env.top_env.pos
     
+    def get_context_state(self):
+        """ Position of the object and whether it is held, which persist between the movements until a reset """
+        return np.array(self.env.top_env.pos), self.env.top_env.move
+    
+    def set_context_state(self, state):
+        self.env.top_env.pos, self.env.top_env.move = np.array(state[0]), state[1]
+    
+    def compute_lower_traj(self, m_traj):
+        """ Hand position and tool end trajectory of shape (T, 4) of the arm and stick starting at rest,
+        and the number of steps where the stick is held
+        """
+        arm = self.env.lower_env.lower_env
+        stick = self.env.lower_env.top_env
+        hand = arm.compute_sensori_effect_batch(arm.compute_motor_command(np.array(m_traj, dtype=float)))
+        held, _, _, tool = stick.compute_sensori_traj(hand, False, stick.rest_state[0:2], stick.rest_state[2])
+        return np.concatenate((hand[..., 0:2], tool), axis=-1), np.sum(held)
+    
+    def compute_motor_command(self, m_ag):
+        """ With the rollout cache, a command already seen reuses its motor trajectory and the 
+        arm and stick trajectories, which only depend on the command.
+        The cache is not used with the gui as it needs the logs of the arm and stick.
+        """
+        if self.rollout_cache is None or self.gui:
+            return DynamicEnvironment.compute_motor_command(self, m_ag)
+        key = np.array(bounds_min_max(m_ag, self.conf.m_mins, self.conf.m_maxs), dtype=float).tostring()
+        entry = self.rollout_cache.get(key)
+        if entry is None:
+            m_traj = DynamicEnvironment.compute_motor_command(self, m_ag)
+            s_lower, n_held = self.compute_lower_traj(m_traj)
+            entry = (m_traj, s_lower, n_held)
+            self.rollout_cache.put(key, entry)
+        else:
+            # Draws of the stick noise (zero here), to keep the random stream as without cache
+            np.random.randn(entry[2])
+        self.lower_traj = entry[1]
+        return entry[0]
+    
+    def compute_sensori_traj(self, m_traj):
+        if self.noise == 2:
+            # Step by step, to draw the noise of the stick and the sensory noise of each step in turn
+            return np.array([self.env.update(m_t, reset=False, log=False) for m_t in m_traj])
+        if self.lower_traj is None:
+            return DynamicEnvironment.compute_sensori_traj(self, m_traj)
+        s_lower = self.lower_traj
+        self.lower_traj = None
+        return np.hstack((s_lower, self.env.top_env.update(s_lower, reset=False, log=False)))
+    
     # Change object sensory space to be 2D as relative change of position ds
     def compute_sensori_effect(self, m_traj):
         c = self.current_context
@@ -305,42 +531,87 @@ class ICDL2016Environment(DynamicEnvironment):
         #print "s", s
         s_o_end = s[[-4,-1]]
         #print "s_o_end", s_o_end
-        res = list(s[:-6]) + list(np.array(s_o_end) - np.array(c))
-        #print res
-        s_ = res
-        #print "s_", s_
-        obj_end_pos_y = s_o_end[1]
-        tool1_moved = (abs(s_[-5] - s_[-3]) > 0.0001)
-        #tool2_moved = (abs(ms[-5] - ms[-3]) > 0.0001)
-        tool1_touched_obj = tool1_moved and (abs(s_[-3] - obj_end_pos_y) < 0.0001)
-        #tool2_touched_obj = tool2_moved and (abs(ms[-3] - obj_end_pos_y) < 0.0001)
-        obj_moved = abs(s_[-1]) > 0.0001
-    
-        obj_moved_with_hand = obj_moved and (not tool1_touched_obj)# and (not tool2_touched_obj)
-        #print "obj_end_pos_y", obj_end_pos_y, "tool end y", s_[-3]
-#         if tool1_moved:
-#             print "tool moved"
-#         if tool1_touched_obj:
-#             print "object moved by tool"
-#             #raise
-#         elif obj_moved_with_hand:
-#             print "object moved by hand"
-             
-        
-        if tool1_touched_obj or (tool1_moved and not obj_moved_with_hand):
-            tool_traj = [st[2:4] for st in self.s_traj]
-            min_dist = min([np.linalg.norm(np.array(st) - np.array(s_o_end)) for st in tool_traj])
-            #print min_dist
+        ds_o = s_o_end - c
+        outcome = outcome_codes(s[9], s[11], ds_o[1], obj_end=s_o_end[1])
+        #print "obj_end_pos_y", s_o_end[1], "tool end y", s[11]
+        
+        if tool_used(outcome):
+            traj = self.s_traj[:, 2:4] # tool end
         else:
-            hand_traj = [sh[:2] for sh in self.s_traj]
-            min_dist = min([np.linalg.norm(np.array(sh) - np.array(s_o_end)) for sh in hand_traj])
+            traj = self.s_traj[:, 0:2] # hand
+        min_dist = np.sqrt(np.min(sq_dist(traj, s_o_end)))
+        #print min_dist
         
-        #print list(s[:-6]), [min_dist], list(np.array(s_o_end) - np.array(c))
-        res = list(s[:-6]) + [min_dist] + list(np.array(s_o_end) - np.array(c))
+        #print s[:-6], min_dist, ds_o
+        res = np.concatenate((s[:-6], [min_dist], ds_o))
         
         #print "s env", res
         self.env.lower_env.reset() # reset arm and tools but not object
         self.env.top_env.move = 0 # tools have been reset so object must not follow them
         return res
     
-        
\ No newline at end of file
+    def update_batch(self, m_ags, contexts):
+        """ Computes the sensory effects of n motor commands in one pass.
+        
+        :param numpy.array m_ags: motor commands of shape (n, 9)
+        :param numpy.array contexts: object positions before each movement, of shape (n, 2)
+        :returns: an array of shape (n, 17) with the context followed by the sensory effect of each movement, as returned by ContextEnvironment in 'mcs' mode
+        
+        .. note:: Each movement starts with the arm and stick at rest and the object still at its context. The state of the environment is not modified.
+        """
+        contexts = np.array(contexts, dtype=float)
+        if self.noise == 2:
+            # The movements are computed step by step (see compute_sensori_traj)
+            return self.update_batch_sequential(m_ags, contexts)
+        arm = self.env.lower_env.lower_env
+        stick = self.env.lower_env.top_env
+        obj = self.env.top_env
+        m_traj = self.compute_motor_command_batch(m_ags)
+        hand = arm.compute_sensori_effect_batch(arm.compute_motor_command(m_traj))
+        s_lower = np.concatenate((hand[..., 0:2], stick.compute_sensori_effect_batch(hand)), axis=-1)
+        s_traj = np.concatenate((s_lower, obj.compute_sensori_effect_batch(s_lower, contexts)), axis=-1)
+        s = self.compute_sensori_params_batch(s_traj)
+        
+        s_o_end = s[:, [-4,-1]]
+        ds_o = s_o_end - contexts
+        use_tool = tool_used(outcome_codes(s[:, 9], s[:, 11], ds_o[:, 1], obj_end=s_o_end[:, 1]))
+        traj = np.where(use_tool[:, None, None], s_traj[..., 2:4], s_traj[..., 0:2])
+        min_dist = np.min(np.sqrt(np.sum((traj - s_o_end[:, None, :]) ** 2, axis=-1)), axis=1)
+        
+        return np.hstack((contexts, s[:, :-6], min_dist[:, None], ds_o))
+    
+    def compute_traj_batch(self, m_ags, contexts):
+        """ Arm, stick and object trajectories of n motor commands, in the format of their logs.
+        
+        :param numpy.array m_ags: motor commands of shape (n, 9)
+        :param numpy.array contexts: object positions before each movement, of shape (n, 2)
+        :returns: for each movement, the logs of the environment (see viewer.set_logs)
+        
+        .. note:: As in update_batch, each movement starts with the arm and stick at rest and the object still at its context.
+        """
+        arm = self.env.lower_env.lower_env
+        stick = self.env.lower_env.top_env
+        obj = self.env.top_env
+        angles = arm.compute_motor_command(self.compute_motor_command_batch(m_ags))
+        hand = arm.compute_sensori_effect_batch(angles)
+        held, handle_pos, angle, end_pos = stick.compute_sensori_traj(hand, False, stick.rest_state[0:2], stick.rest_state[2])
+        pos, move = obj.compute_sensori_traj(np.concatenate((hand[..., 0:2], end_pos), axis=-1), np.array(contexts, dtype=float), 0)
+        logs = []
+        for i in range(len(m_ags)):
+            arm_logs = list(angles[i])
+            stick_logs = [[handle_pos[i, t], angle[i, t], list(end_pos[i, t]), held[i, t]] for t in range(self.move_steps)]
+            obj_logs = [[pos[i, t], move[i, t]] for t in range(self.move_steps)]
+            logs.append([[arm_logs, stick_logs], obj_logs])
+        return logs
+    
+    def update_batch_sequential(self, m_ags, contexts):
+        """ Same as update_batch but runs the movements one by one through update
+        """
+        pos, move = self.env.top_env.pos, self.env.top_env.move
+        res = []
+        for m_ag, c in zip(m_ags, contexts):
+            self.env.top_env.pos = np.array(c)
+            self.env.top_env.move = 0
+            res.append(np.hstack((c, self.update(m_ag, reset=False, log=False))))
+        self.env.top_env.pos, self.env.top_env.move = pos, move
+        return np.array(res)
@@ -56,6 +56,7 @@ class ToolsExperiment(Experiment):
             
         self.n_trials = n_trials
         self.trial = 0
+        self.step_offset = 0
         
         
         
@@ -90,6 +91,60 @@ class ToolsExperiment(Experiment):
         experiment.log.purge()
         
         return experiment
+    
+    @classmethod
+    def from_checkpoint(cls, config, log_dir, checkpoint):
+        """
+        Experiment whose agent is restored from the checkpoint file saved by save_checkpoint, without replaying the logs.
+        """
+        experiment = cls(config=config, context_mode=config.context_mode, log_dir=log_dir)
+        experiment.load_checkpoint(checkpoint)
+        return experiment
+    
+    def fast_forward_log(self, log, start, end):
+        """
+        Replay the iterations start to end of log (the motor and sensori logs of a trial, with its bootstrap for start 0) 
+        on the agent: replayed from 0 to the ages of the checkpoints of the trial, the sensorimotor models 
+        of the agent are the ones saved in the checkpoints. The interest models are not replayed.
+        """
+        log_i = ExperimentLog(None, None, None)
+        if start == 0:
+            log_i._logs["bootstrap"] = log._logs["bootstrap"]
+        log_i._logs["motor"] = log._logs["motor"][start:end]
+        log_i._logs["sensori"] = log._logs["sensori"][start:end]
+        self.ag.fast_forward(log_i, forward_im=False)
+    
+    def checkpoint_filename(self, iteration):
+        return self.log_dir + '/checkpoint{}-{}.pickle'.format(self.trial, iteration)
+    
+    def save_checkpoint(self, iteration):
+        self.ag.save_checkpoint(self.checkpoint_filename(iteration), 
+                                trial=self.trial,
+                                context_state=self.env.env.get_context_state(),
+                                step=self.current_step % self.config.log_each)
+        
+    def load_checkpoint(self, checkpoint):
+        """
+        Restore the agent, the context of the environment and numpy's random generator, 
+        the next run continues the steps of the run that saved the checkpoint, and the rows of its metrics file.
+        """
+        extra = self.ag.load_checkpoint(checkpoint, restore_random_state=True)
+        self.env.env.set_context_state(extra['context_state'])
+        self.step_offset = extra['step']
+        self.trial = extra['trial']
+        self.open_metrics(resume=True)
+        
+    def open_metrics(self, resume=False):
+        """
+        Write the metrics of the agent in the file of the trial: a new trial starts a new file, 
+        a resumed run keeps the rows written before its checkpoint.
+        """
+        if self.config.metrics_interval:
+            self.ag.metrics.open(self.log_dir + '/metrics{}.json'.format(self.trial), resume_t=self.ag.t if resume else None)
+        
+    def _init(self, current_step=0):
+        # A run split by checkpoints continues the steps of the run, and thus its schedule of context resets
+        Experiment._init(self, current_step + self.step_offset)
         
     
     def motor_babbling(self, n, range_div = 1.):
@@ -105,6 +160,7 @@ class ToolsExperiment(Experiment):
             #print 'Babbling iteration', i, ': m =', m, 's =', s
             ms = np.hstack((m,s))
             self.ag.update_sensorimotor_models(ms)
+            self.log.add('bootstrap', ms)
 
         self._update_logs()
 
@@ -128,6 +184,9 @@ class ToolsExperiment(Experiment):
     def start_trial(self):
 
         print '[' + self.config.tag + '] ' + 'Starting trial', self.trial 
+        
+        metrics = self.ag.metrics
+        self.open_metrics()
 
         #self.ag.subscribe('movement', self)
         # xp.evaluate_at(eval_at, tc)
@@ -144,11 +203,24 @@ class ToolsExperiment(Experiment):
         log_each = self.config.log_each
         
         for i in range((self.config.iter) / log_each):
-            t_start = time.time()
-            self.run(log_each)
+            done = i * log_each
+            for iteration in sorted(self.config.checkpoint_at):
+                if done < iteration <= (i + 1) * log_each:
+                    with metrics.timer('run'):
+                        self.run(iteration - done)
+                    with metrics.timer('checkpoint'):
+                        self.save_checkpoint(iteration)
+                    done = iteration
+                    self.step_offset = done - i * log_each
+            if done < (i + 1) * log_each:
+                with metrics.timer('run'):
+                    self.run((i + 1) * log_each - done)
+            self.step_offset = 0
             print '[' + self.config.tag + '] ' + 'Run up to ' + str((i + 1) * log_each)
-            print "Time for", log_each, "iterations :", time.time() - t_start
-            self.save_logs()
+            with metrics.timer('save_logs'):
+                self.save_logs()
+        metrics.close((self.config.iter / log_each) * log_each)
+        self.env.env.close()
             
 
     def save_logs(self):
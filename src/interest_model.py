@@ -0,0 +1,164 @@
+import numpy as np
+
+from explauto.interest_model.random import RandomInterest, MiscRandomInterest, ContextRandomInterest, competence_dist
+
+from dataset import GrowableDataset
+
+
+def use_growable_datasets(im, dtype=np.float64, names=('data_xc', 'data_sr')):
+    """
+    Replace the (empty) datasets of the interest model im by GrowableDatasets storing their points with type dtype.
+    """
+    for name in names:
+        if hasattr(im, name):
+            dataset = getattr(im, name)
+            assert len(dataset) == 0
+            setattr(im, name, GrowableDataset(dataset.dim_x, dataset.dim_y, dtype=dtype))
+
+
+class CompactMiscRandomInterest(MiscRandomInterest):
+    """
+    MiscRandomInterest whose points are stored in GrowableDatasets of type dtype (e.g. np.float32 to halve the memory of the points, the kd-trees stay float64).
+    """
+    def __init__(self, conf, expl_dims, dtype=np.float64, **kwargs):
+        MiscRandomInterest.__init__(self, conf, expl_dims, **kwargs)
+        use_growable_datasets(self, dtype)
+
+
+class CompactContextRandomInterest(ContextRandomInterest):
+    """
+    ContextRandomInterest whose points are stored in GrowableDatasets of type dtype (see CompactMiscRandomInterest).
+    """
+    def __init__(self, conf, expl_dims, dtype=np.float64, **kwargs):
+        ContextRandomInterest.__init__(self, conf, expl_dims, **kwargs)
+        use_growable_datasets(self, dtype)
+
+
+class IncrementalMiscRandomInterest(RandomInterest):
+    """
+    Interest model with the competences and progresses of MiscRandomInterest, maintained incrementally.
+
+    The goals and reached points are stored in GrowableDatasets (of type dtype): the nearest neighbors
+    queries of update and competence_pt use their IncrementalIndex, in O(k log(n)).
+    The competences of the last win_size points are kept in a ring buffer with the running sums
+    of its two halves, so that interest(), competence() and interest_global() are O(1).
+    """
+    def __init__(self, conf, expl_dims, competence_measure=competence_dist, win_size=1000, 
+                 competence_mode='knn', k=20, progress_mode='local', mode='sg', dtype=np.float64, context_mode=None):
+        RandomInterest.__init__(self, conf, expl_dims)
+        if competence_mode not in ['knn', 'sw'] or progress_mode not in ['local', 'global']:
+            raise NotImplementedError
+        self.competence_measure = competence_measure
+        self.win_size = win_size
+        self.competence_mode = competence_mode
+        self.k = k
+        self.progress_mode = progress_mode
+        self.mode = mode
+        self.context_mode = context_mode
+        self.dist_max = np.linalg.norm(self.bounds[0,:] - self.bounds[1,:])
+        self.data_xc = GrowableDataset(len(expl_dims), 1, dtype=dtype)
+        self.data_sr = GrowableDataset(len(expl_dims), 0, dtype=dtype)
+        self.current_progress = 0.
+        self.current_interest = 0.
+        self.window = np.zeros(win_size) # ring buffer of the last competences
+        self.sum_window = 0.
+        self.sum_window_beg = 0. # sum of the first half of the window (the oldest competences)
+        
+    def n_points(self):
+        return len(self.data_xc)
+    
+    def window_size(self):
+        return min(self.n_points(), self.win_size)
+    
+    def window_values(self):
+        """ Competences of the window, oldest first """
+        n = self.n_points()
+        return self.window[np.arange(n - self.window_size(), n) % self.win_size]
+    
+    def add_competence(self, c):
+        n = self.n_points()
+        size = self.window_size()
+        first = (n - size) % self.win_size
+        middle = self.window[(first + size / 2) % self.win_size]
+        if size == self.win_size:
+            # The oldest competence leaves the window and the middle one goes to its first half
+            self.sum_window += c - self.window[first]
+            self.sum_window_beg += middle - self.window[first]
+        else:
+            self.sum_window += c
+            if size % 2 == 1:
+                self.sum_window_beg += middle
+        self.window[n % self.win_size] = c
+        
+    def update_interest(self, i):
+        self.current_progress += (1. / self.win_size) * (i - self.current_progress)
+        self.current_interest = abs(self.current_progress)
+        
+    def update(self, xy, ms, snnp=None, sp=None):
+        x = xy[self.expl_dims]
+        c = self.competence_measure(x, ms[self.expl_dims], dist_max=self.dist_max)
+        interest = self.interest_xc(x, c)
+        if self.progress_mode == 'local':
+            self.update_interest(interest)
+        self.add_competence(c)
+        self.data_xc.add_xy(x, [c])
+        self.data_sr.add_xy(ms[self.expl_dims])
+        if self.n_points() % self.win_size == 0:
+            # Sum again the window to reset the rounding errors of the running sums
+            values = self.window_values()
+            self.sum_window = np.sum(values)
+            self.sum_window_beg = np.sum(values[:len(values) / 2])
+        return interest
+    
+    def interest_xc(self, x, c):
+        if self.n_points() > 0:
+            idx_sg_NN = self.data_xc.nn_x(x, k=1)[1][0]
+            c_old = competence_dist(x, self.data_sr.get_x(idx_sg_NN), dist_max=self.dist_max)
+            return c - c_old
+        else:
+            return 0.
+        
+    def competence_global(self):
+        if self.n_points() > 0:
+            return self.sum_window / self.window_size()
+        else:
+            return 0.
+        
+    def competence_pt(self, x):
+        if self.competence_mode == 'knn' and self.n_points() > self.k:
+            _, idxs = self.data_xc.nn_x(x, k=self.k)
+            return np.mean(self.data_xc.data[idxs, -1], dtype=float)
+        else:
+            return self.competence_global()
+        
+    def interest_pt(self, x):
+        if self.n_points() > self.k:
+            _, idxs = self.data_xc.nn_x(x, k=self.k)
+            v = self.data_xc.data[sorted(idxs), -1].astype(float)
+            return np.abs(np.mean(v[len(v) / 2:]) - np.mean(v[:len(v) / 2]))
+        else:
+            return self.interest_global()
+        
+    def interest_global(self): 
+        if self.n_points() < 2:
+            return 0.
+        else:
+            size = self.window_size()
+            comp_beg = self.sum_window_beg / (size / 2)
+            comp_end = (self.sum_window - self.sum_window_beg) / (size - size / 2)
+            return np.abs(comp_end - comp_beg)
+        
+    def competence(self): return self.competence_global()
+    
+    def interest(self): 
+        if self.progress_mode == 'local':
+            return self.current_interest
+        else:
+            return self.interest_global()
+
+
+class IncrementalContextRandomInterest(IncrementalMiscRandomInterest):
+    """
+    IncrementalMiscRandomInterest of the modules with a context: the goals are sampled on the dimensions
+    out of the context with sample_given_context.
+    """
@@ -0,0 +1,99 @@
+import os
+import json
+import time
+from contextlib import contextmanager
+
+
+class Metrics(object):
+    """
+    Counters, gauges and timers of a run, written every interval iterations as one line
+    of an append-only file: a JSON object per line, to follow with tail -f or to load with
+    pandas.read_json(filename, lines=True).
+
+    - counters: counts since the start of the run (count)
+    - gauges: last values (gauge), or values computed before each flush by the reporters (add_reporter)
+    - timers: seconds spent and number of calls since the previous flush (timer, timed)
+
+    Without a file (e.g. when an agent is fast-forwarded from a log), nothing is reported nor written.
+    """
+    def __init__(self, interval=200):
+        self.interval = interval
+        self.filename = None
+        self.counters = {}
+        self.gauges = {}
+        self.timers = {} # name -> [seconds, number of calls]
+        self.reporters = []
+        self.t_flushed = None # iteration of the last row
+
+    def open(self, filename, resume_t=None):
+        """ Start a new file of rows, or, for a run resumed at iteration resume_t, continue the rows of the file
+        written before resume_t (the rows written after the checkpoint by the interrupted run are removed) """
+        self.filename = filename
+        self.t_flushed = None
+        rows = []
+        if resume_t is not None and os.path.exists(self.filename):
+            with open(self.filename, 'r') as f:
+                rows = [line for line in f if json.loads(line)['t'] < resume_t]
+            if len(rows) > 0:
+                self.t_flushed = json.loads(rows[-1])['t']
+        with open(self.filename, 'w') as f:
+            f.writelines(rows)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        self.gauges[name] = value
+
+    @contextmanager
+    def timer(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            timer = self.timers.setdefault(name, [0., 0])
+            timer[0] += time.time() - start
+            timer[1] += 1
+
+    def add_reporter(self, reporter):
+        """ reporter(metrics) sets the gauges that are only computed when a row is written """
+        self.reporters.append(reporter)
+
+    def step(self, t):
+        """ Write a row if iteration t is a multiple of the interval """
+        if self.filename is not None and self.interval and t % self.interval == 0:
+            self.flush(t)
+
+    def flush(self, t):
+        if self.filename is None:
+            return
+        for reporter in self.reporters:
+            reporter(self)
+        row = dict(t=t, time=time.time())
+        row.update(self.counters)
+        row.update(self.gauges)
+        for name, (seconds, n) in self.timers.items():
+            row['time_' + name] = seconds
+            row['n_' + name] = n
+        self.timers = {}
+        with open(self.filename, 'a') as f:
+            f.write(json.dumps(row, sort_keys=True, default=lambda v: v.tolist()) + '\n')
+        self.t_flushed = t
+
+    def close(self, t):
+        """ Write the last row at iteration t if it was not written, and stop writing """
+        if self.t_flushed != t:
+            self.flush(t)
+        self.filename = None
+
+
+def timed(name):
+    """ Decorator timing the calls of a method with the timer name of the metrics attribute of the object """
+    def decorator(method):
+        def timed_method(self, *args, **kwargs):
+            with self.metrics.timer(name):
+                return method(self, *args, **kwargs)
+        timed_method.__name__ = method.__name__
+        timed_method.__doc__ = method.__doc__
+        return timed_method
+    return decorator
@@ -11,9 +11,11 @@ from explauto.utils import rand_bounds
 from explauto.utils.config import make_configuration
 from explauto.exceptions import ExplautoBootstrapError
 
+from sensorimotor_model import s_changed
+
 
 class Module(Agent):
-    def __init__(self, config, mid):
+    def __init__(self, config, mid, sm_store=None):
             
         self.config = config #global config
         self.mconf = config.modules[mid] # module config
@@ -46,6 +48,9 @@ class Module(Agent):
         
         sm_cls, sm_kwargs = config.sms[self.mconf['sm_name']]
         self.sm = sm_cls(self.conf, **sm_kwargs)
+        if sm_store is not None:
+            # The points of the module are the columns m and s of the ms rows of the shared store
+            self.sm.use_store(sm_store, self.mconf['m'], self.mconf['s'])
         #print self.mconf['s'], self.config.agent.s_dims
         #self.s_filter = [self.config.agent.s_dims.index(sd) for sd in self.mconf['s']]
         
@@ -66,6 +71,7 @@ class Module(Agent):
         self.top_down_interest = 0 
         self.top_down_points = Queue.Queue()
         self.own_interest = 0
+        self.invalidate_interest()
         
         #init_position = self.environment.rest_position()
         
@@ -78,6 +84,7 @@ class Module(Agent):
             for t in log.logs['im_update' + '_' + from_log_mod]:
                 #print t, self.mconf['m'], self.mconf['s']
                 self.interest_model.update(*t)
+            self.invalidate_interest()
 
     def motor_babbling(self):
         return rand_bounds(self.conf.m_bounds)[0]
@@ -216,11 +223,38 @@ class Module(Agent):
         self.sensorimotor_model.update(m, s)   
         self.t += 1 
     
+    def skip_sm(self, n=1):
+        """ Count n movements perceived by the module but not stored in its sensorimotor model (see Supervisor.no_effect_filter)
+        """
+        self.t += n
+    
+    def update_sm_batch(self, ms_array, rows=None):
+        """ Update the sensorimotor model with the rows of ms_array in one batch,
+        rows being their indexes in the shared store of the supervisor if any.
+        """
+        if len(ms_array) == 0:
+            return
+        m_list = list(ms_array[:, self.mconf['m']])
+        s_list = list(ms_array[:, self.mconf['s']])
+        if rows is not None:
+            self.sensorimotor_model.update_batch(m_list, s_list, rows=rows)
+        elif hasattr(self.sensorimotor_model, 'use_store'):
+            self.sensorimotor_model.update_batch(m_list, s_list)
+        else:
+            # explauto's update_batch sets bootstrapped_s: check the sensory points as its update does
+            sm = self.sensorimotor_model
+            bootstrapped_s = sm.bootstrapped_s
+            last_s = sm.model.imodel.fmodel.dataset.get_y(sm.t - 1) if sm.t > 0 else None
+            sm.update_batch(m_list, s_list)
+            sm.bootstrapped_s = bootstrapped_s or s_changed(last_s, ms_array[:, self.mconf['s']])
+        self.t += len(ms_array)
+    
     def update_im(self, m, s):
         #print self.mid, self.s, s
         if self.t >= self.mconf['motor_babbling_n_iter']:
             if self.im_mode == "sg" or self.im_mode == "sp":
                 self.interest_model.update(hstack((m, self.s)), hstack((m, s)))
+                self.invalidate_interest()
                 #self.emit('im_update_' + self.mid, (hstack((m, self.s)), hstack((m, s))))
             else:
                 raise NotImplementedError
@@ -231,13 +265,49 @@ class Module(Agent):
         else:
             return - np.inf
         
+    def competence_reached_batch(self, s_batch):
+        """ Competence reached for each goal of s_batch, of shape (n, len(s)).
+        The sensorimotor model can provide competence_for_context_batch to evaluate all the contexts in one query.
+        """
+        s_batch = np.atleast_2d(s_batch)
+        if self.sensorimotor_model.size() == 0:
+            return - np.inf * np.ones(len(s_batch))
+        contexts = s_batch[:, :self.context_mode["context_n_dims"]]
+        if hasattr(self.sensorimotor_model, "competence_for_context_batch"):
+            return np.asarray(self.sensorimotor_model.competence_for_context_batch(contexts), dtype=float)
+        else:
+            return np.array([self.sensorimotor_model.competence_for_context(c) for c in contexts], dtype=float)
+        
+    def sm_size(self):
+        """ Number of points in the dataset of the sensorimotor model """
+        return len(self.sensorimotor_model.model.imodel.fmodel.dataset)
+    
+    def report_metrics(self, metrics):
+        metrics.gauge('competence_' + self.mid, self.competence())
+        metrics.gauge('progress_' + self.mid, self.interest_model.current_progress)
+        metrics.gauge('interest_' + self.mid, self.interest())
+        metrics.gauge('sm_points_' + self.mid, self.sm_size())
+        metrics.gauge('im_points_' + self.mid, len(self.interest_model.data_xc))
+        if hasattr(self.sensorimotor_model, 'n_evicted'):
+            metrics.gauge('sm_evicted_' + self.mid, self.sensorimotor_model.n_evicted())
+        
     def competence_pt(self, m): return self.interest_model.competence_pt(m)
     def interest_pt(self, m): return self.sensorimotor_model.interest_pt(m)
         
+    def invalidate_interest(self):
+        """ The interest model or the top-down points changed: competence() and interest() are computed again at their next call.
+        """
+        self.cached_competence = None
+        self.interest_weights = None # weights of the cached interest
+        
     def competence(self):        
-        return self.interest_model.competence()
+        if self.cached_competence is None:
+            self.cached_competence = self.interest_model.competence()
+        return self.cached_competence
         
     def interest(self, interest_weights=[1., 0.000, 1.]):
+        if self.interest_weights == interest_weights:
+            return self.overall_interest
         self.own_interest = interest_weights[0] * self.interest_model.interest()
         #print "Own Interest ", self.mid, self.own_interest
         self.top_down_interest = interest_weights[1] * self.top_down_points.qsize() 
@@ -246,6 +316,7 @@ class Module(Agent):
         self.overall_interest = (self.own_interest + 
                                  self.top_down_interest + 
                                  self.social_interest)
+        self.interest_weights = list(interest_weights)
         return self.overall_interest
 
     def perceive(self, m, s, context=None, has_control=True):
@@ -0,0 +1,53 @@
+import numpy as np
+
+
+# Bits of the outcome codes
+TOOL_MOVED = 1
+OBJ_MOVED = 2
+TOOL_TOUCHED_OBJ = 4
+
+
+def outcome_codes(tool_start, tool_end, obj_dy, obj_end=None, threshold=0.0001):
+    """
+    Outcome codes of movements: OR of TOOL_MOVED, OBJ_MOVED and TOOL_TOUCHED_OBJ, as an int8 array
+    (or scalar for scalar arguments).
+
+    :param tool_start, tool_end: y position of the tool end before and after the movement
+    :param obj_dy: y displacement of the object
+    :param obj_end: y position of the object after the movement (None: TOOL_TOUCHED_OBJ is never set)
+    """
+    tool_moved = np.abs(np.subtract(tool_start, tool_end)) > threshold
+    codes = tool_moved * TOOL_MOVED | (np.abs(obj_dy) > threshold) * OBJ_MOVED
+    if obj_end is not None:
+        codes = codes | (tool_moved & (np.abs(np.subtract(tool_end, obj_end)) < threshold)) * TOOL_TOUCHED_OBJ
+    return np.asarray(codes).astype(np.int8)[()]
+
+
+def classify_outcomes(s):
+    """
+    Outcome codes of sensory points s (context followed by the 15 sensory dims, as logged by the experiment),
+    of shape (17,) or (n, 17).
+    """
+    s = np.asarray(s, dtype=float)
+    return outcome_codes(s[..., -6], s[..., -4], s[..., -1], obj_end=s[..., 1] + s[..., -1])
+
+
+def tool_moved(codes):
+    return np.bitwise_and(codes, TOOL_MOVED) != 0
+
+
+def obj_moved(codes):
+    return np.bitwise_and(codes, OBJ_MOVED) != 0
+
+
+def tool_touched_obj(codes):
+    return np.bitwise_and(codes, TOOL_TOUCHED_OBJ) != 0
+
+
+def obj_moved_with_hand(codes):
+    return np.bitwise_and(codes, OBJ_MOVED | TOOL_TOUCHED_OBJ) == OBJ_MOVED
+
+
+def tool_used(codes):
+    """ Movements learned by the tool module: the tool touched the object, or moved without moving the object """
+    return tool_touched_obj(codes) | (np.bitwise_and(codes, TOOL_MOVED | OBJ_MOVED) == TOOL_MOVED)
@@ -0,0 +1,89 @@
+"""
+Render the movements of chosen iterations of a trial from its motor and sensory logs,
+one image per timestep, without re-running the experiment.
+
+The arm, stick and object trajectories are recomputed from the motor commands and the contexts,
+which is exact with noise=0.
+
+Usage: python render.py log_dir config_name trial iteration [iteration ...]
+
+Images are written to log_dir/img/mvt-<config_name>-<trial>/mvt-<iteration>-<timestep>.png,
+a movie can then be made with e.g.
+ffmpeg -framerate 25 -i mvt-<iteration>-%02d.png mvt-<iteration>.mp4
+"""
+
+import os
+import sys
+import cPickle
+import multiprocessing
+import numpy as np
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+from config import configs
+from viewer import set_logs
+
+
+env = None
+fig = None
+ax = None
+
+
+def init_worker(config_name):
+    global env, fig, ax
+    env_cfg = configs[config_name].env_cfg
+    env = env_cfg["env_cls"](**dict(env_cfg["env_conf"], gui=False))
+    fig, ax = plt.subplots(figsize=(12., 12.))
+
+
+def render_movement(args):
+    iteration, logs, img_dir, format, dpi = args
+    set_logs(env.env, logs)
+    for i in range(env.move_steps):
+        ax.cla()
+        env.env.plot(ax, i)
+        ax.set_xlim([-1.3, 1.3])
+        ax.set_ylim([-1.3, 1.3])
+        ax.set_aspect('equal')
+        fig.savefig(img_dir + 'mvt-' + str(iteration) + "-" + '{0:02d}'.format(i) + '.' + format, format=format, dpi=dpi, bbox_inches='tight')
+    return iteration
+
+
+def main(log_dir, config_name, trial, iterations, n_procs=None, format='png', dpi=100):
+
+    config = configs[config_name]
+
+    logs = {}
+    for key in ["motor", "sensori"]:
+        filename = log_dir + config_name + '/log{}-'.format(trial) + key + '-{}.pickle'.format(0)
+        with open(filename, 'r') as f:
+            logs[key] = cPickle.load(f)
+
+    m_ags = np.array([logs["motor"][iteration] for iteration in iterations])
+    contexts = np.array([logs["sensori"][iteration][:config.context_mode["context_n_dims"]] for iteration in iterations])
+
+    traj_env = config.env_cfg["env_cls"](**dict(config.env_cfg["env_conf"], gui=False))
+    movements_logs = traj_env.compute_traj_batch(m_ags, contexts)
+
+    img_dir = log_dir + "img/mvt-" + config_name + "-" + str(trial) + "/"
+    if not os.path.exists(img_dir):
+        os.makedirs(img_dir)
+
+    pool = multiprocessing.Pool(n_procs, init_worker, (config_name,))
+    try:
+        for iteration in pool.imap_unordered(render_movement, [(iteration, mvt_logs, img_dir, format, dpi) for iteration, mvt_logs in zip(iterations, movements_logs)]):
+            print "Rendered iteration", iteration
+    finally:
+        pool.close()
+        pool.join()
+
+
+if __name__ == "__main__":
+
+    log_dir = sys.argv[1]
+    config_name = sys.argv[2]
+    trial = sys.argv[3]
+    iterations = [int(iteration) for iteration in sys.argv[4:]]
+    main(log_dir, config_name, trial, iterations)
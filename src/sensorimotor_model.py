@@ -0,0 +1,177 @@
+import numpy as np
+
+from explauto.sensorimotor_model.non_parametric import NonParametric, ContextNonParametric
+
+from dataset import GrowableDataset, StoreView, BoundedDataset
+
+
+def s_changed(last_s, s_array):
+    """
+    True if one of the sensory points of s_array differs from the previous one,
+    the first one being compared to last_s (None if there is no previous point).
+    """
+    if len(s_array) == 0:
+        return False
+    if last_s is not None and not np.array_equal(s_array[0], last_s):
+        return True
+    return bool(np.any(s_array[1:] != s_array[:-1]))
+
+
+class IncrementalNonParametric(NonParametric):
+    """
+    NonParametric model whose points are stored in a GrowableDataset,
+    with an incrementally maintained nearest neighbors index instead of rebuilding a kd-tree on all the points.
+    The points are stored with type dtype (e.g. np.float32 to halve the memory of the points, the kd-trees stay float64).
+    """
+    def __init__(self, conf, leaf_size=1024, dtype=np.float64, **kwargs):
+        NonParametric.__init__(self, conf, **kwargs)
+        self.leaf_size = leaf_size
+        fmodel = self.model.imodel.fmodel
+        fmodel.dataset = GrowableDataset(fmodel.dim_x, fmodel.dim_y, leaf_size=leaf_size, dtype=dtype)
+
+    def use_store(self, store, dims_x, dims_y):
+        """
+        Store the points as the columns dims_x, dims_y of the rows of a SharedStore (with its own dtype), before any update.
+        """
+        fmodel = self.model.imodel.fmodel
+        assert len(fmodel.dataset) == 0
+        assert (len(dims_x), len(dims_y)) == (fmodel.dim_x, fmodel.dim_y)
+        fmodel.dataset = StoreView(store, dims_x, dims_y, leaf_size=self.leaf_size)
+
+    def update_batch(self, m_list, s_list, rows=None):
+        """
+        Add the points in one batch, with the same bootstrap detection as update.
+        With a SharedStore, rows are the indexes of the points in the store, which are referenced and not copied.
+        """
+        n = len(m_list)
+        dataset = self.model.imodel.fmodel.dataset
+        last_s = dataset.get_y(self.t - 1) if self.t > 0 else None
+        if not self.bootstrapped_s and s_changed(last_s, np.reshape(s_list, (n, -1))):
+            self.bootstrapped_s = True
+        if rows is None:
+            self.model.add_xy_batch(m_list, s_list)
+        else:
+            dataset.add_rows(rows)
+        self.t += n
+
+
+class IncrementalContextNonParametric(ContextNonParametric):
+    """
+    ContextNonParametric model whose points are stored in a GrowableDataset (see IncrementalNonParametric).
+    With grid_size, the queries on the context dimensions alone (the first dimensions of y) use a GridIndex
+    of grid_size^context_n_dims cells over the context sensory bounds. The other queries, as the inverse queries on
+    all the dimensions of y, stay on the kd-trees: the grid is exact for them too, but their other dimensions widen
+    the scan of the cells (about 30 times slower than the kd-trees for the outcomes of mod3 with 50000 points).
+    """
+    def __init__(self, conf, leaf_size=1024, dtype=np.float64, grid_size=None, **kwargs):
+        ContextNonParametric.__init__(self, conf, **kwargs)
+        self.leaf_size = leaf_size
+        fmodel = self.model.imodel.fmodel
+        if grid_size is None:
+            self.grid = None
+        else:
+            context_mode = kwargs['context_mode']
+            self.grid = ([fmodel.dim_x + d for d in range(context_mode["context_n_dims"])], 
+                         context_mode["context_sensory_bounds"], 
+                         grid_size)
+        fmodel.dataset = GrowableDataset(fmodel.dim_x, fmodel.dim_y, leaf_size=leaf_size, dtype=dtype, grid=self.grid)
+
+    def use_store(self, store, dims_x, dims_y):
+        """
+        See IncrementalNonParametric.use_store
+        """
+        fmodel = self.model.imodel.fmodel
+        assert len(fmodel.dataset) == 0
+        assert (len(dims_x), len(dims_y)) == (fmodel.dim_x, fmodel.dim_y)
+        fmodel.dataset = StoreView(store, dims_x, dims_y, leaf_size=self.leaf_size, grid=self.grid)
+
+    def competence_for_context(self, context):
+        return self.competence_for_context_batch([context])[0]
+
+    def competence_for_context_batch(self, contexts):
+        """
+        Competence of the model for each context of contexts, of shape (n, context_n_dims):
+        the opposite of the distance to the nearest context of its points, from one query for all the contexts.
+        """
+        dataset = self.model.imodel.fmodel.dataset
+        contexts = np.atleast_2d(contexts)
+        if len(dataset) == 0:
+            return - np.inf * np.ones(len(contexts))
+        dists, _ = dataset.nn_y_sub_batch(contexts, range(contexts.shape[1]), k=1)
+        return - dists[:, 0]
+
+    def update_batch(self, m_list, s_list, rows=None):
+        # See IncrementalNonParametric.update_batch
+        n = len(m_list)
+        dataset = self.model.imodel.fmodel.dataset
+        last_s = dataset.get_y(self.t - 1) if self.t > 0 else None
+        if not self.bootstrapped_s and s_changed(last_s, np.reshape(s_list, (n, -1))):
+            self.bootstrapped_s = True
+        if rows is None:
+            self.model.add_xy_batch(m_list, s_list)
+        else:
+            dataset.add_rows(rows)
+        self.t += n
+
+
+class BoundedNonParametric(IncrementalNonParametric):
+    """
+    NonParametric model storing at most capacity points in a BoundedDataset,
+    with the retention policy retention ('reservoir', 'recency' or 'coverage', see BoundedDataset).
+    """
+    def __init__(self, conf, capacity=100000, retention='reservoir', resolution=0.1, seed=0, **kwargs):
+        IncrementalNonParametric.__init__(self, conf, **kwargs)
+        fmodel = self.model.imodel.fmodel
+        fmodel.dataset = BoundedDataset(fmodel.dim_x, fmodel.dim_y, capacity, retention=retention, resolution=resolution, 
+                                        seed=seed, rebuild_size=self.leaf_size, dtype=fmodel.dataset.data.dtype)
+        self.last_s = None
+
+    def update(self, m, s):
+        # The indexes of the points are not their order of arrival: compare s to the previous s to detect bootstrap
+        self.model.add_xy(tuple(m), tuple(s))
+        self.t += 1
+        if not self.bootstrapped_s and self.last_s is not None and not list(s) == list(self.last_s):
+            self.bootstrapped_s = True
+        self.last_s = s
+
+    def update_batch(self, m_list, s_list, rows=None):
+        # The points may be evicted as they are added: add them one by one
+        for m, s in zip(m_list, s_list):
+            self.update(m, s)
+
+    def n_evicted(self):
+        return self.model.imodel.fmodel.dataset.n_evicted
+
+    def use_store(self, store, dims_x, dims_y):
+        raise NotImplementedError
+
+
+class BoundedContextNonParametric(IncrementalContextNonParametric):
+    """
+    ContextNonParametric model storing at most capacity points in a BoundedDataset (see BoundedNonParametric).
+    """
+    def __init__(self, conf, capacity=100000, retention='reservoir', resolution=0.1, seed=0, **kwargs):
+        IncrementalContextNonParametric.__init__(self, conf, **kwargs)
+        fmodel = self.model.imodel.fmodel
+        fmodel.dataset = BoundedDataset(fmodel.dim_x, fmodel.dim_y, capacity, retention=retention, resolution=resolution, 
+                                        seed=seed, rebuild_size=self.leaf_size, dtype=fmodel.dataset.data.dtype)
+        self.last_s = None
+
+    def update(self, m, s):
+        # See BoundedNonParametric.update
+        self.model.add_xy(tuple(m), tuple(s))
+        self.t += 1
+        if not self.bootstrapped_s and self.last_s is not None and not list(s) == list(self.last_s):
+            self.bootstrapped_s = True
+        self.last_s = s
+
+    def update_batch(self, m_list, s_list, rows=None):
+        # The points may be evicted as they are added: add them one by one
+        for m, s in zip(m_list, s_list):
+            self.update(m, s)
+
+    def n_evicted(self):
+        return self.model.imodel.fmodel.dataset.n_evicted
+
+    def use_store(self, store, dims_x, dims_y):
+        raise NotImplementedError
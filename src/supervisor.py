@@ -1,4 +1,6 @@
+import copy
 import Queue
+import cPickle
 import numpy as np
 
 from numpy import zeros
@@ -7,7 +9,10 @@ from explauto.utils import rand_bounds, bounds_min_max, softmax_choice, prop_cho
 
 from hierarchy import Hierarchy
 from module import Module
-from action import Action
+from action import compile_plans
+from dataset import SharedStore, NoveltyFilter, GrowableDataset, StoreView
+from metrics import Metrics, timed
+from outcomes import classify_outcomes, tool_moved, obj_moved, tool_touched_obj, obj_moved_with_hand, tool_used
 
 
 class Supervisor(Observable):
@@ -40,6 +45,13 @@ class Supervisor(Observable):
         self.credit_tool_move = {}
         self.credit_hand_move = {}
         
+        self.sm_store = SharedStore(self.conf.ndims, dtype=self.config.dtype) if self.config.shared_sm_store else None # ms rows shared by the sensorimotor models
+        # mod3 stores one movement without effect on the object per cell of its sensory space (context and outcome)
+        self.no_effect_filter = NoveltyFilter(self.config.no_effect_resolution) if self.config.no_effect_resolution is not None else None
+        
+        self.metrics = Metrics(self.config.metrics_interval) # written in a file by the experiment
+        self.metrics.add_reporter(self.report_metrics)
+        
         self.hierarchy = Hierarchy() # Build Hierarchy
         for motor_space in self.config.m_spaces.values():
             self.hierarchy.add_motor_space(motor_space)
@@ -52,10 +64,14 @@ class Supervisor(Observable):
             self.last_space_children_choices[mid] = Queue.Queue()
             self.credit_tool_move[mid] = 0
             self.credit_hand_move[mid] = 0
+        
+        self.plans = compile_plans(self.config.modules, self.hierarchy)
+        # Motor commands written by the plans, reused by each production
+        self.m_buffer = zeros((max([plan.n_iterations for plan in self.plans.values()]), len(self.conf.m_dims)))
             
         
     def init_module(self, mid):
-        self.modules[mid] = Module(self.config, mid)
+        self.modules[mid] = Module(self.config, mid, sm_store=self.sm_store)
         self.chosen_modules[mid] = 0
         self.hierarchy.add_module(mid)  
 #         for space in self.config.modules[mid]['m_list']:
@@ -97,20 +113,21 @@ class Supervisor(Observable):
         elif mode == 'prop':
             w = interests.values()
             s_space = s_spaces.keys()[prop_choice(w, eps=0.2)]
-            if self.t % 200 == 1:
-                print
-                print 'iterations', self.t - 1
-                print "competences", np.array([self.modules[mid].competence() for mid in self.modules.keys()])
-                print "progresses", np.array([self.modules[mid].interest_model.current_progress for mid in self.modules.keys()])
-                print "interests", np.array([self.modules[mid].interest() for mid in self.modules.keys()])
-                print "sm db n points", [len(self.modules[mid].sensorimotor_model.model.imodel.fmodel.dataset) for mid in self.modules.keys()]
-                print "im db n points", [len(self.modules[mid].interest_model.data_xc) for mid in self.modules.keys()]
-                print self.chosen_modules
-                print "made tool moved object", self.credit_tool_move
-                print "made hand moved object", self.credit_hand_move
         
         self.chosen_spaces[s_space] = self.chosen_spaces[s_space] + 1
         return s_space
+    
+    def report_metrics(self, metrics):
+        """ Gauges of the modules and counters of the supervisor, written in each row of the metrics """
+        for mid, mod in self.modules.iteritems():
+            mod.report_metrics(metrics)
+            metrics.gauge('chosen_' + mid, self.chosen_modules[mid])
+            metrics.gauge('credit_tool_move_' + mid, self.credit_tool_move[mid])
+            metrics.gauge('credit_hand_move_' + mid, self.credit_hand_move[mid])
+        for s_space, n in self.chosen_spaces.iteritems():
+            metrics.gauge('chosen_' + s_space, n)
+        if self.no_effect_filter is not None:
+            metrics.gauge('no_effect_filtered', self.no_effect_filter.n_filtered())
         
         
 #     def choose_babbling_module(self, auto_create=False, progress_threshold=1e-2, mode='softmax', weight_by_level=False):
@@ -182,14 +199,101 @@ class Supervisor(Observable):
 #             return self.create_module()
                         
     def fast_forward(self, log, forward_im=False):
-        #ms_list = []
-        for m,s in zip(log.logs['motor'], log.logs['sensori']):
-            ms = np.append(m,s)
-            self.update_sensorimotor_models(ms)
-            #ms_list += [ms]
+        """ Update the sensorimotor models with the movements of log: its bootstrap if any (see ToolsExperiment.motor_babbling), 
+        then its motor and sensori logs.
+        """
+        logs = log.logs
+        if len(logs.get('bootstrap', [])) > 0:
+            self.update_sensorimotor_models_batch(np.array(logs['bootstrap'], dtype=float))
+        if len(logs.get('motor', [])) > 0:
+            ms_array = np.hstack((np.array(logs['motor'], dtype=float), np.array(logs['sensori'], dtype=float)))
+            self.update_sensorimotor_models_batch(ms_array)
         for mid, mod in self.modules.iteritems():
             mod.fast_forward_models(log, ms_list=None, from_log_mod=mid, forward_im=forward_im)        
         
+    # Attributes of the supervisor and of the modules saved in checkpoints, besides the models
+    checkpoint_keys = ['t', 'chosen_modules', 'chosen_spaces', 'mid_control', 'credit_tool_move', 'credit_hand_move', 'sm_store', 'no_effect_filter']
+    checkpoint_module_keys = ['t', 'n_bootstrap', 's', 'sp', 'snn', 'su', 'overall_interest', 'social_interest', 'top_down_interest', 'own_interest']
+    
+    def get_state(self):
+        """
+        State of the agent: sensorimotor and interest models of the modules and counters (not copied), 
+        with the counters of the metrics, which count from the start of the run.
+        """
+        modules = {}
+        for mid, mod in self.modules.iteritems():
+            modules[mid] = dict(sensorimotor_model=mod.sensorimotor_model,
+                                interest_model=mod.interest_model,
+                                top_down_points=list(mod.top_down_points.queue),
+                                **dict((key, getattr(mod, key)) for key in self.checkpoint_module_keys))
+        return dict(modules=modules,
+                    last_space_children_choices=dict((mid, list(q.queue)) for mid, q in self.last_space_children_choices.iteritems()),
+                    metrics_counters=dict(self.metrics.counters),
+                    **dict((key, getattr(self, key)) for key in self.checkpoint_keys))
+    
+    def set_state(self, agent_state):
+        """
+        Restore the state returned by get_state in an agent built with the same config.
+        """
+        for mid, state in agent_state['modules'].iteritems():
+            mod = self.modules[mid]
+            mod.sensorimotor_model = mod.sm = state['sensorimotor_model']
+            mod.interest_model = mod.im = state['interest_model']
+            mod.top_down_points = Queue.Queue()
+            for point in state['top_down_points']:
+                mod.top_down_points.put(point)
+            for key in self.checkpoint_module_keys:
+                setattr(mod, key, state[key])
+            mod.invalidate_interest()
+        for mid, choices in agent_state['last_space_children_choices'].iteritems():
+            self.last_space_children_choices[mid] = Queue.Queue()
+            for choice in choices:
+                self.last_space_children_choices[mid].put(choice)
+        for key in self.checkpoint_keys:
+            setattr(self, key, agent_state[key])
+        self.metrics.counters = dict(agent_state['metrics_counters'])
+    
+    def save_checkpoint(self, filename, **extra):
+        """
+        Save the state of the agent in a binary file, with the state of numpy's random generator 
+        and the extra entries (e.g. the state of the environment).
+        """
+        checkpoint = dict(self.get_state(), random_state=np.random.get_state(), extra=extra)
+        with open(filename, 'wb') as f:
+            cPickle.dump(checkpoint, f, cPickle.HIGHEST_PROTOCOL)
+    
+    def load_checkpoint(self, filename, restore_random_state=False):
+        """
+        Restore the state saved by save_checkpoint in an agent built with the same config, 
+        and return its extra entries.
+        With restore_random_state, numpy's random generator is also reset to its saved state (to resume the run).
+        """
+        with open(filename, 'rb') as f:
+            checkpoint = cPickle.load(f)
+        self.set_state(checkpoint)
+        if restore_random_state:
+            np.random.set_state(checkpoint['random_state'])
+        return checkpoint['extra']
+    
+    def snapshot(self):
+        """
+        Copy of the agent, without the subscribers, whose sensorimotor datasets share their points and kd-trees
+        with the agent until one of the two agents updates them (copy-on-write, see GrowableDataset.snapshot).
+        The rest of the state is copied.
+        """
+        memo = {}
+        if self.sm_store is not None:
+            memo[id(self.sm_store)] = self.sm_store.snapshot()
+        for mod in self.modules.values():
+            dataset = mod.sensorimotor_model.model.imodel.fmodel.dataset
+            if isinstance(dataset, StoreView):
+                memo[id(dataset)] = dataset.snapshot(memo[id(dataset.store)])
+            elif isinstance(dataset, GrowableDataset):
+                memo[id(dataset)] = dataset.snapshot()
+        agent = self.__class__(self.config, self.environment, **self.config.supervisor_config)
+        agent.set_state(copy.deepcopy(self.get_state(), memo))
+        return agent
+        
     def eval_mode(self): 
         self.sm_modes = {}
         for mod in self.modules.values():
@@ -234,27 +338,27 @@ class Supervisor(Observable):
     def get_s(self, ms): return ms[self.conf.s_dims]
                 
     def update_sensorimotor_models(self, ms):
+        if self.sm_store is not None:
+            self.sm_store.append(ms)
             
         #print 'ms', ms
         for mid in ["mod1", "mod2"]:
             self.modules[mid].update_sm(self.modules[mid].get_m(ms), self.modules[mid].get_s(ms))
             
         #print 'ms2', ms
-        obj_end_pos_y = ms[10] + ms[-1]
-        tool1_moved = (abs(ms[-6] - ms[-4]) > 0.0001)
-        #tool2_moved = (abs(ms[-5] - ms[-3]) > 0.0001)
-        tool1_touched_obj = tool1_moved and (abs(ms[-4] - obj_end_pos_y) < 0.0001)
-        #tool2_touched_obj = tool2_moved and (abs(ms[-3] - obj_end_pos_y) < 0.0001)
-        obj_moved = abs(ms[-1]) > 0.0001
-        obj_moved_with_hand = obj_moved and (not tool1_touched_obj)# and (not tool2_touched_obj)
-        if tool1_touched_obj:
+        outcome = classify_outcomes(self.get_s(ms))
+        if tool_moved(outcome):
+            self.metrics.count('tool1_moved')
+        if obj_moved(outcome):
+            self.metrics.count('obj_moved')
+        if tool_touched_obj(outcome):
             if not self.mid_control  == '': 
                 self.credit_tool_move[self.mid_control] += 1
-        if obj_moved_with_hand:
+        if obj_moved_with_hand(outcome):
             if not self.mid_control  == '': 
                 self.credit_hand_move[self.mid_control] += 1
         
-        if tool1_touched_obj or (tool1_moved and not obj_moved_with_hand):
+        if tool_used(outcome):
             self.modules["mod4"].update_sm(self.modules["mod4"].get_m(ms), self.modules["mod4"].get_s(ms))
             #print ms
             #print "tool1 moved"
@@ -265,15 +369,69 @@ class Supervisor(Observable):
 #             #print "tool2 moved"
 #             return "mod6"
         else:
-            self.modules["mod3"].update_sm(self.modules["mod3"].get_m(ms), self.modules["mod3"].get_s(ms))
+            mod3 = self.modules["mod3"]
+            if obj_moved(outcome) or self.no_effect_filter is None or self.no_effect_filter.add(mod3.get_s(ms), representative=mod3.sm_size()):
+                mod3.update_sm(mod3.get_m(ms), mod3.get_s(ms))
+            else:
+                mod3.skip_sm()
             #print "no tool moved"
-            return "mod3" if obj_moved else None
+            return "mod3" if obj_moved(outcome) else None
               
         
+    def update_sensorimotor_models_batch(self, ms_array):
+        """
+        Same as calling update_sensorimotor_models on each row of ms_array, of shape (n, len(ms)), in order,
+        with one batch update per module. Returns the array of the modules returned for each row.
+        """
+        ms_array = np.asarray(ms_array, dtype=float)
+        rows = None
+        if self.sm_store is not None:
+            rows = self.sm_store.append_batch(ms_array)
+        
+        outcomes = classify_outcomes(ms_array[:, self.conf.s_dims])
+        moved = obj_moved(outcomes)
+        tool_module = tool_used(outcomes)
+        self.metrics.count('tool1_moved', int(np.sum(tool_moved(outcomes))))
+        self.metrics.count('obj_moved', int(np.sum(moved)))
+        if not self.mid_control  == '': 
+            self.credit_tool_move[self.mid_control] += int(np.sum(tool_touched_obj(outcomes)))
+            self.credit_hand_move[self.mid_control] += int(np.sum(obj_moved_with_hand(outcomes)))
+        
+        mod3_rows = ~tool_module
+        n_skipped = 0
+        if self.no_effect_filter is not None:
+            # Movements without effect are filtered in order, as with update_sensorimotor_models
+            no_effect = np.where(mod3_rows & ~moved)[0]
+            mod3 = self.modules["mod3"]
+            keys = ms_array[no_effect][:, mod3.mconf['s']]
+            first = self.no_effect_filter.add_batch(keys)
+            mod3_rows[no_effect[~first]] = False
+            n_skipped = int(np.sum(~first))
+            # Indexes of the representatives in the dataset of mod3
+            indexes = mod3.sm_size() + np.cumsum(mod3_rows) - 1
+            for key, index in zip(keys[first], indexes[no_effect[first]]):
+                self.no_effect_filter.set_representative(key, index)
+        
+        all_rows = np.ones(len(ms_array), dtype=bool)
+        for mid, mask in [("mod1", all_rows), ("mod2", all_rows), ("mod3", mod3_rows), ("mod4", tool_module)]:
+            self.modules[mid].update_sm_batch(ms_array[mask], rows=None if rows is None else rows[mask])
+        if n_skipped > 0:
+            self.modules["mod3"].skip_sm(n_skipped)
+        
+        return np.where(tool_module, "mod4", np.where(moved, "mod3", None))
+        
+    def competences_reached(self, mids, s_batch):
+        """ 
+        Competences of the modules mids for each goal of s_batch, of shape (n, len(s)),
+        in an array of shape (n, len(mids)): one batched query per module.
+        """
+        return np.column_stack([self.modules[mid].competence_reached_batch(s_batch) for mid in mids])
+    
     def choose_space_child(self, s_space, s, mode="competence", local="local", k=1):
         """ 
         Choose the children of space s_space among modules that have
         the good sensori spaces, maximizing competence.
+        With k > 1, return the probabilities of choosing each child (see choose_space_child_probas).
         """
         try:
             possible_mids = self.hierarchy.space_children(s_space)
@@ -285,41 +443,31 @@ class Supervisor(Observable):
             return mid 
         
         eps = 0.05
+        if k > 1 and mode in ["competence", "competence_prop", "interest", "interest_prop"]:
+            return self.choose_space_child_probas(s_space, [s], mode, local)[0]
+        
         if mode == "competence":
             if local:
 #                 for mid in ["mod2", "mod5", 'mod6']:
 #                     dists, idxs = self.modules[mid].sensorimotor_model.model.imodel.fmodel.dataset.nn_y(s, k=1)
 #                     print mid, dists, idxs, self.modules[mid].sensorimotor_model.model.imodel.fmodel.dataset.get_xy(idxs[0]), y, s
-                competences = [self.modules[pmid].competence_reached(s) for pmid in possible_mids]
+                competences = list(self.competences_reached(possible_mids, [s])[0])
 #                 print "sm db n points", [len(self.modules[mid].sensorimotor_model.model.imodel.fmodel.dataset) for mid in self.modules.keys()]
             else:
                 competences = [self.modules[pmid].competence() for pmid in possible_mids]
             #print "choose space child", competences
-            if k == 1:
-                mid = possible_mids[greedy(competences, eps)]
-                #print "chosen mid", mid
-                return mid
-            else:
-                mid = possible_mids[greedy(competences)]
-                return [(1. - (eps/2.) if pmid == mid else eps/2.) for pmid in possible_mids]
+            mid = possible_mids[greedy(competences, eps)]
+            #print "chosen mid", mid
+            return mid
         
         if mode == "competence_prop":
             if local:
-#                 for mid in ["mod2", "mod5", 'mod6']:
-#                     dists, idxs = self.modules[mid].sensorimotor_model.model.imodel.fmodel.dataset.nn_y(s, k=1)
-#                     print mid, dists, idxs, self.modules[mid].sensorimotor_model.model.imodel.fmodel.dataset.get_xy(idxs[0]), y, s
-                competences = [self.modules[pmid].competence_reached(s) for pmid in possible_mids]
+                competences = list(self.competences_reached(possible_mids, [s])[0])
                 #print "choose space child", competences
-#                 print "sm db n points", [len(self.modules[mid].sensorimotor_model.model.imodel.fmodel.dataset) for mid in self.modules.keys()]
             else:
                 competences = [self.modules[pmid].competence() for pmid in possible_mids]
-            if k == 1:
-                mid = possible_mids[prop_choice(competences, eps)]
-                return mid
-            else:
-                rectified = 1. / np.array(competences)
-                probas = rectified / np.sum(rectified)
-                return ((1. - eps) * probas + eps/2.)
+            mid = possible_mids[prop_choice(competences, eps)]
+            return mid
             
         elif mode == "interest":  
             if local=="local":
@@ -327,13 +475,9 @@ class Supervisor(Observable):
             else:
                 interests = [self.modules[pmid].interest() for pmid in possible_mids]
             #print "choose space child", interests
-            if k == 1:
-                mid = possible_mids[greedy(interests, eps=eps)]
-                #print "chosen mid", mid
-                return mid
-            else:
-                mid = possible_mids[greedy(interests)]
-                return [(1. - (eps/2.) if pmid == mid else eps/2.) for pmid in possible_mids]
+            mid = possible_mids[greedy(interests, eps=eps)]
+            #print "chosen mid", mid
+            return mid
             
         elif mode == "interest_prop":  
             if local=="local":
@@ -341,18 +485,50 @@ class Supervisor(Observable):
             else:
                 interests = [self.modules[pmid].interest() for pmid in possible_mids]
             #print "choose space child", interests
-            if k == 1:
-                mid = possible_mids[prop_choice(interests, eps=eps)]
-                #print "chosen mid", mid
-                return mid
-            else:
-                return ((1. - eps) * (np.array(interests) / np.sum(interests)) + eps/2.)
+            mid = possible_mids[prop_choice(interests, eps=eps)]
+            #print "chosen mid", mid
+            return mid
             
         elif mode == "random":   
             mid = np.random.choice(possible_mids)
             self.chosen_modules[mid] = self.chosen_modules[mid] + 1
             return mid
         
+    def choose_space_child_probas(self, s_space, s_batch, mode="competence", local="local"):
+        """ 
+        Probabilities of choosing each child module of space s_space, for each goal of s_batch,
+        in an array of shape (n, n_children), for the competence, competence_prop, interest and interest_prop modes.
+        """
+        s_batch = np.atleast_2d(s_batch)
+        possible_mids = self.hierarchy.space_children(s_space)
+        n = len(s_batch)
+        if len(possible_mids) == 1:
+            return np.ones((n, 1))
+        
+        eps = 0.05
+        if mode in ["competence", "competence_prop"]:
+            if local:
+                values = self.competences_reached(possible_mids, s_batch)
+            else:
+                values = np.tile([self.modules[pmid].competence() for pmid in possible_mids], (n, 1))
+        elif mode in ["interest", "interest_prop"]:
+            if local=="local":
+                values = np.array([[self.modules[pmid].interest_pt(s) for pmid in possible_mids] for s in s_batch])
+            else:
+                values = np.tile([self.modules[pmid].interest() for pmid in possible_mids], (n, 1))
+        else:
+            raise ValueError("Unknown mode of choice of the children: " + str(mode) + " (competence, competence_prop, interest or interest_prop)")
+        
+        if mode in ["competence", "interest"]:
+            # The most probable child is chosen greedily (with the default exploration of greedy) for each goal
+            best = np.array([greedy(v) for v in values])
+            return np.where(np.arange(len(possible_mids)) == best[:, None], 1. - (eps/2.), eps/2.)
+        elif mode == "competence_prop":
+            rectified = 1. / values
+            return (1. - eps) * rectified / np.sum(rectified, axis=1)[:, None] + eps/2.
+        else:
+            return (1. - eps) * values / np.sum(values, axis=1)[:, None] + eps/2.
+        
     def get_mid_children(self, mid, m, mode="competence", local="local"):
         children = []
         i = 0
@@ -368,7 +544,11 @@ class Supervisor(Observable):
         #print "Choice of children of mid", mid, children 
         return children
     
-    def produce_module(self, mid, babbling=True, s=None, s_dims=None, allow_explore=False, explore=None, n_explo_points=0, context_ms=None):
+    def produce_module(self, mid, babbling=True, s=None, s_dims=None, allow_explore=False, explore=None, n_explo_points=0, context_ms=None, step=0):
+        """
+        Adds the motor commands produced by module mid, following its plan from step, to self.m_buffer.
+        Returns the number of steps written, which depends on the children chosen.
+        """
         mod = self.modules[mid]  
         #print "produce module ", mid, babbling, s, allow_explore, n_explo_points
         if self.explo == "all":
@@ -420,24 +600,22 @@ class Supervisor(Observable):
         
         children = self.get_mid_children(mid, m_deps, mode=ccm, local=self.ccm_local)
             
-        deps_actions = []
-        i = 0
-        for dep in children:
+        plan = self.plans[mid]
+        n_steps = 0
+        for (start, end), dep in zip(plan.slots, children):
+            dep_step = step + plan.slot_step(n_steps)
             if self.hierarchy.is_module(dep):
-                m_dep = m_deps[i:i+len(self.config.modules[dep]['s'])]
-                i = i + len(self.config.modules[dep]['s'])
-                #self.modules[dep].top_down_points.put(m_dep)
-                deps_actions.append(self.produce_module(dep, babbling=False, s=m_dep, allow_explore=False, explore=explore))
+                #self.modules[dep].top_down_points.put(m_deps[start:end])
+                n_dep = self.produce_module(dep, babbling=False, s=m_deps[start:end], allow_explore=False, explore=explore, step=dep_step)
             else:
-                m_dep = m_deps[i:i+len(dep)]
-                i = i + len(dep)
-                #print "Action prim mod", mid, "m_dims", dep, "m_deps", m_dep
-                deps_actions.append(Action(m_dep, m_dims=dep))
-        
-        #print "Action mod", mid, "operator", self.config.modules[mid]['operator'], "m_deps", m_deps, 'actions=',deps_actions
-        return Action(m_deps, operator=self.config.modules[mid]['operator'], actions=deps_actions)
+                #print "Action prim mod", mid, "m_dims", dep, "m_deps", m_deps[start:end]
+                self.m_buffer[dep_step, dep] += m_deps[start:end]
+                n_dep = 1
+            n_steps = plan.next_step(n_steps, n_dep)
+        return n_steps
         
         
+    @timed('produce')
     def produce(self, context_ms=None):
         for mid in self.modules.keys():
             self.last_space_children_choices[mid] = Queue.Queue()
@@ -482,10 +660,12 @@ class Supervisor(Observable):
             self.modules[mid].s = s
         else:
             self.mid_control = None
-        action = self.produce_module(mid, babbling=False, s=s, explore=explore)
-        self.m_seq = action.get_m_seq(len(self.conf.m_dims))
+        self.m_buffer[:self.plans[mid].n_iterations] = 0.
+        n_iterations = self.produce_module(mid, babbling=False, s=s, explore=explore)
+        self.m_seq = self.m_buffer[:n_iterations].copy()
         return self.m_seq
     
+    @timed('perceive')
     def perceive(self, s_seq_, context=None, higher_module_perceive=True):
         s_seq = self.sensory_primitive(s_seq_)
         self.ms_seq = []
@@ -504,6 +684,7 @@ class Supervisor(Observable):
         if self.mid_control is not None and (mid == self.mid_control or mid is None or self.mid_control in ["mod1", "mod2"]):
             self.modules[self.mid_control].update_im(self.modules[self.mid_control].get_m(last_ms), self.modules[self.mid_control].get_s(last_ms))
             #print "mid control upd"
+        self.metrics.step(self.t - 1)
         
     def subscribe_topics_mids(self, topics, observer):
         for topic in topics:
@@ -0,0 +1,64 @@
+"""
+Checks of the action plans, run with python test_action.py (or pytest).
+"""
+from hierarchy import Hierarchy
+from action import compile_plans
+
+
+def make_modules(top_operator):
+    # The sensory space [2, 3] is produced by hand in one step and by arm in two steps
+    modules = dict(hand=dict(operator="par", m_list=[[0, 1]]),
+                   arm=dict(operator="seq", m_list=[[0, 1], [0, 1]]),
+                   top=dict(operator=top_operator, m_list=[[2, 3], [0, 1]]))
+    hierarchy = Hierarchy()
+    hierarchy.add_motor_space([0, 1])
+    hierarchy.add_sensori_space([2, 3])
+    for mid in modules:
+        hierarchy.add_module(mid, modules[mid]['operator'])
+    hierarchy.add_edge_module_space("hand", [2, 3])
+    hierarchy.add_edge_module_space("arm", [2, 3])
+    return modules, hierarchy
+
+
+def run_steps(plan, n_slots):
+    # Steps of the slots of plan and its number of steps, the slots taking n_slots steps
+    steps = []
+    n_steps = 0
+    for n_slot in n_slots:
+        steps.append(plan.slot_step(n_steps))
+        n_steps = plan.next_step(n_steps, n_slot)
+    return steps, n_steps
+
+
+def test_different_numbers_of_steps():
+    modules, hierarchy = make_modules("seq")
+    plans = compile_plans(modules, hierarchy)
+    assert plans["hand"].n_iterations == 1
+    assert plans["arm"].n_iterations == 2
+    assert plans["top"].n_iterations == 3
+    assert plans["top"].slots == [(0, 2), (2, 4)]
+    # The second slot follows the child chosen for the first one
+    assert run_steps(plans["top"], [1, 1]) == ([0, 1], 2)
+    assert run_steps(plans["top"], [2, 1]) == ([0, 2], 3)
+
+    modules, hierarchy = make_modules("par")
+    plans = compile_plans(modules, hierarchy)
+    assert plans["top"].n_iterations == 2
+    assert run_steps(plans["top"], [1, 1]) == ([0, 0], 1)
+    assert run_steps(plans["top"], [2, 1]) == ([0, 0], 2)
+
+
+def test_unknown_operator():
+    modules, hierarchy = make_modules(None)
+    try:
+        compile_plans(modules, hierarchy)
+    except ValueError:
+        pass
+    else:
+        assert False
+
+
+if __name__ == "__main__":
+    test_different_numbers_of_steps()
+    test_unknown_operator()
+    print "OK"
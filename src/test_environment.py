@@ -0,0 +1,66 @@
+"""
+Checks of the environment, run with python test_environment.py (or pytest).
+"""
+import numpy as np
+
+from config import Config
+
+
+def make_context_env(noise):
+    config = Config(name="test", hierarchy_type=1)
+    config.env_cfg["env_conf"]["gui"] = False
+    config.env_cfg["env_conf"]["noise"] = noise
+    return config.env_cls(**config.env_cfg)
+
+
+def make_env(noise):
+    return make_context_env(noise).env
+
+
+def update_per_step(noise, m_ags, contexts):
+    # Reference without the DMP map nor the trajectories computed in one pass: the motor trajectories 
+    # are rolled out by pydmps, and the arm, stick and object are updated step by step
+    context_env = make_context_env(noise)
+    env = context_env.env
+    env.motor_dmp.map = None
+    env.compute_sensori_traj = lambda m_traj: np.array([env.env.update(m_t, reset=False, log=False) for m_t in m_traj])
+    s = []
+    for m_ag, context in zip(m_ags, contexts):
+        env.set_context_state((context, 0))
+        s.append(context_env.update(m_ag, reset=False))
+    return np.array(s)
+
+
+def test_update_batch_equals_update():
+    # The ndarray pipeline of update_batch matches the movements computed one by one through update.
+    # Noise 2 is not checked: update_batch runs it through update_batch_sequential.
+    rng = np.random.RandomState(0)
+    m_ags = rng.uniform(-1., 1., (100, 9))
+    contexts = rng.uniform(-1.5, 1.5, (100, 2))
+    for noise in [0, 1]:
+        env = make_env(noise)
+        np.random.seed(1)
+        s_batch = env.update_batch(m_ags, contexts)
+        np.random.seed(1)
+        s_seq = env.update_batch_sequential(m_ags, contexts)
+        assert s_batch.shape == (100, 17)
+        assert np.allclose(s_batch, s_seq, rtol=0., atol=1e-13), (noise, np.max(np.abs(s_batch - s_seq)))
+
+
+def test_update_batch_equals_reference():
+    rng = np.random.RandomState(0)
+    m_ags = rng.uniform(-1., 1., (100, 9))
+    contexts = rng.uniform(-1.5, 1.5, (100, 2))
+    # With noise 2, the random draws are also the ones of the step by step simulation
+    for noise in [0, 1, 2]:
+        np.random.seed(1)
+        s_batch = make_env(noise).update_batch(m_ags, contexts)
+        np.random.seed(1)
+        s_ref = update_per_step(noise, m_ags, contexts)
+        assert np.allclose(s_batch, s_ref, rtol=0., atol=1e-10), (noise, np.max(np.abs(s_batch - s_ref)))
+
+
+if __name__ == "__main__":
+    test_update_batch_equals_update()
+    test_update_batch_equals_reference()
+    print "OK"
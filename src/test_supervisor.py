@@ -0,0 +1,165 @@
+"""
+Checks of the supervisor, run with python test_supervisor.py (or pytest).
+"""
+import cPickle
+import json
+import shutil
+import tempfile
+import numpy as np
+
+from explauto.experiment.log import ExperimentLog
+
+from config import Config
+from experiment import ToolsExperiment
+
+
+def make_config(sm_model, **kwargs):
+    config = Config(name="test", hierarchy_type=1, sm_model=sm_model, **kwargs)
+    config.env_cfg["env_conf"]["gui"] = False
+    return config
+
+
+def make_supervisor(sm_model):
+    config = make_config(sm_model)
+    env = config.env_cls(**config.env_cfg)
+    return config.supervisor_cls(config, env, **config.supervisor_config), env
+
+
+def make_log(env, n_rest, n, seed=0):
+    # n_rest movements at rest in one context (the same sensory points), then n random movements
+    rng = np.random.RandomState(seed)
+    m_ags = np.vstack((np.zeros((n_rest, 9)), rng.uniform(-1., 1., (n, 9))))
+    contexts = np.vstack((np.repeat([[0.5, 0.5]], n_rest, axis=0), rng.uniform(-1.5, 1.5, (n, 2))))
+    s = env.env.update_batch(m_ags, contexts)
+    log = ExperimentLog(None, None, None)
+    for m_ag, s_ag in zip(m_ags, s):
+        log.add('motor', m_ag)
+        log.add('sensori', s_ag)
+    return log
+
+
+def dataset(mod):
+    ds = mod.sensorimotor_model.model.imodel.fmodel.dataset
+    return np.array([ds.get_x(i) for i in range(len(ds))]), np.array([ds.get_y(i) for i in range(len(ds))])
+
+
+def test_fast_forward_equals_update():
+    # With explauto's models, fast_forward learns the same datasets and detects the bootstrap
+    # of the sensory spaces as the updates row by row, the log being replayed in two parts.
+    for n_first in [1, 5, 10, 20]:
+        sup_batch, env = make_supervisor('knn')
+        sup_rows, _ = make_supervisor('knn')
+        log = make_log(env, 10, 50)
+        ms_array = np.hstack((log.logs['motor'], log.logs['sensori']))
+        for part in [slice(0, n_first), slice(n_first, None)]:
+            part_log = ExperimentLog(None, None, None)
+            for topic in ['motor', 'sensori']:
+                for x in log.logs[topic][part]:
+                    part_log.add(topic, x)
+            sup_batch.fast_forward(part_log)
+            for ms in ms_array[part]:
+                sup_rows.update_sensorimotor_models(ms)
+            for mid in sup_rows.modules:
+                mod_batch, mod_rows = sup_batch.modules[mid], sup_rows.modules[mid]
+                assert mod_batch.t == mod_rows.t, mid
+                assert mod_batch.sensorimotor_model.bootstrapped_s == mod_rows.sensorimotor_model.bootstrapped_s, (n_first, mid)
+                if mod_rows.sensorimotor_model.t > 0:
+                    for a, b in zip(dataset(mod_batch), dataset(mod_rows)):
+                        assert np.array_equal(a, b), mid
+            if n_first <= 10 and part.start == 0:
+                # The movements at rest do not bootstrap the sensory spaces
+                assert not any(mod.sensorimotor_model.bootstrapped_s for mod in sup_rows.modules.values())
+
+
+def test_replay_equals_checkpoint():
+    # Replayed from the logs of a trial up to the ages of its checkpoints, or from one of its checkpoints
+    # as in the analyses, the agent has the sensorimotor models saved in the checkpoints.
+    log_dir = tempfile.mkdtemp() + '/'
+    try:
+        config = make_config('incremental_knn', supervisor_ccm="competence", iterations=200)
+        config.checkpoint_at = [50, 150]
+        np.random.seed(0)
+        xp = ToolsExperiment(config, context_mode=config.context_mode, log_dir=log_dir)
+        xp.trial = 1
+        xp.start_trial()
+        
+        log = ExperimentLog(None, None, None)
+        for key in ["bootstrap", "motor", "sensori"]:
+            with open(xp.log_dir + '/log1-' + key + '-0.pickle', 'r') as f:
+                log._logs[key] = cPickle.load(f)
+        assert len(log._logs["bootstrap"]) == config.bootstrap
+        
+        xp_replay = ToolsExperiment(config, context_mode=config.context_mode, log_dir=log_dir)
+        # Agent loaded from the first checkpoint, then replayed from its age
+        xp_mixed = ToolsExperiment(config, context_mode=config.context_mode, log_dir=log_dir)
+        grid = np.random.uniform(-1.5, 1.5, (200, 2))
+        mids = xp.ag.hierarchy.space_children(config.s_spaces["s_o"])
+        age = 0
+        for iteration in config.checkpoint_at:
+            xp_replay.fast_forward_log(log, age, iteration)
+            if age == 0:
+                xp_mixed.ag.load_checkpoint(xp.checkpoint_filename(iteration))
+            else:
+                xp_mixed.fast_forward_log(log, age, iteration)
+            age = iteration
+            xp_checkpoint = ToolsExperiment(config, context_mode=config.context_mode, log_dir=log_dir)
+            xp_checkpoint.ag.load_checkpoint(xp.checkpoint_filename(iteration))
+            for xp_i in [xp_replay, xp_mixed]:
+                for mid in xp.ag.modules:
+                    assert xp_i.ag.modules[mid].sm_size() == xp_checkpoint.ag.modules[mid].sm_size(), (iteration, mid)
+                    assert xp_i.ag.modules[mid].t == xp_checkpoint.ag.modules[mid].t, (iteration, mid)
+                assert np.array_equal(xp_i.ag.competences_reached(mids, grid), xp_checkpoint.ag.competences_reached(mids, grid))
+    finally:
+        shutil.rmtree(log_dir)
+
+
+def test_resume_keeps_metrics():
+    # A run interrupted after its checkpoint and resumed from it continues the metrics file of the trial: 
+    # the rows and the counters are the ones of the run without interruption (the timers aside).
+    log_dir = tempfile.mkdtemp() + '/'
+    try:
+        config = make_config('incremental_knn', supervisor_ccm="competence", iterations=400)
+        config.checkpoint_at = [200]
+        config.metrics_interval = 100
+        np.random.seed(0)
+        xp = ToolsExperiment(config, context_mode=config.context_mode, log_dir=log_dir)
+        xp.trial = 1
+        xp.start_trial()
+        with open(xp.log_dir + '/metrics1.json', 'r') as f:
+            rows = [json.loads(line) for line in f]
+        # Rows of the run interrupted at iteration 250, the last one written after the checkpoint
+        with open(xp.log_dir + '/metrics1.json', 'w') as f:
+            for row in rows[:2] + [dict(rows[1], t=250)]:
+                f.write(json.dumps(row) + '\n')
+        
+        xp_resumed = ToolsExperiment.from_checkpoint(config, log_dir, xp.checkpoint_filename(200))
+        xp_resumed.run(200)
+        xp_resumed.ag.metrics.close(400)
+        with open(xp.log_dir + '/metrics1.json', 'r') as f:
+            rows_resumed = [json.loads(line) for line in f]
+        assert [row['t'] for row in rows] == [row['t'] for row in rows_resumed] == [100, 200, 300, 400]
+        for row, row_resumed in zip(rows, rows_resumed):
+            for key in row:
+                if not key.startswith('time') and not key.startswith('n_'):
+                    assert row[key] == row_resumed[key], (row['t'], key)
+    finally:
+        shutil.rmtree(log_dir)
+
+
+def test_inverse_returns_a_copy():
+    # The motor commands returned by inverse are not overwritten by the next production
+    sup, env = make_supervisor('incremental_knn')
+    sup.fast_forward(make_log(env, 0, 100))
+    m_seq = sup.inverse("s_h", np.zeros(6))
+    m_seq_copy = np.array(m_seq)
+    sup.inverse("s_h", np.ones(6))
+    assert len(m_seq) == sup.plans["mod1"].n_iterations
+    assert np.array_equal(m_seq, m_seq_copy)
+
+
+if __name__ == "__main__":
+    test_fast_forward_equals_update()
+    test_replay_equals_checkpoint()
+    test_resume_keeps_metrics()
+    test_inverse_returns_a_copy()
+    print "OK"
@@ -0,0 +1,115 @@
+import os
+import sys
+import multiprocessing
+from Queue import Full, Empty
+
+
+def get_logs(env):
+    """
+    Per-step logs of the components of a (hierarchically) combined environment.
+    """
+    if hasattr(env, 'envs'):
+        return [get_logs(e) for e in env.envs]
+    if hasattr(env, 'top_env'):
+        return [get_logs(env.lower_env), get_logs(env.top_env)]
+    return list(env.logs)
+
+
+def set_logs(env, logs):
+    if hasattr(env, 'envs'):
+        for e, l in zip(env.envs, logs):
+            set_logs(e, l)
+    elif hasattr(env, 'top_env'):
+        set_logs(env.lower_env, logs[0])
+        set_logs(env.top_env, logs[1])
+    else:
+        env.logs = logs
+
+
+def render_loop(env, queue, move_steps, lims, nice, backend):
+    """
+    Plot the movements received on the queue, skipping to the last one if several are waiting.
+    The process is niced so as to let the CPU to the experiment.
+    """
+    os.nice(nice)
+    # The process is forked with the modules of the experiment:
+    # if pyplot is already loaded, its backend is replaced so as not to share the GUI of the experiment
+    import matplotlib
+    if 'matplotlib.pyplot' in sys.modules:
+        import matplotlib.pyplot as plt
+        plt.switch_backend(backend)
+    else:
+        matplotlib.use(backend)
+        import matplotlib.pyplot as plt
+    plt.ion()
+    ax = plt.subplot()
+    plt.gcf().set_size_inches(12., 12., forward=True)
+    plt.gca().set_aspect('equal')
+    while True:
+        logs = queue.get()
+        try:
+            while logs is not None:
+                logs = queue.get_nowait()
+        except Empty:
+            pass
+        if logs is None:
+            break
+        set_logs(env, logs)
+        for i in range(move_steps):
+            plt.cla()
+            env.plot(ax, i)
+            plt.xlim(lims)
+            plt.ylim(lims)
+            plt.draw()
+            plt.pause(0.0001)
+    plt.close('all')
+
+
+class LiveViewer(object):
+    """
+    Plot the movements of an environment in a separate process.
+
+    The logs of each movement are sent on a bounded queue without waiting:
+    the movements arriving while the queue is full are dropped, so that plotting never slows down the experiment.
+    The rendering process works on its own copy of the environment, forked at creation,
+    and plots with the matplotlib backend backend (an interactive one). close() stops it.
+    """
+    def __init__(self, env, move_steps, lims=(-1.3, 1.3), queue_size=2, nice=10, backend='TkAgg'):
+        self.env = env
+        self.queue = multiprocessing.Queue(queue_size)
+        self.process = multiprocessing.Process(target=render_loop, args=(env, self.queue, move_steps, lims, nice, backend))
+        self.process.daemon = True
+        self.process.start()
+        self.n_sent = 0
+        self.n_dropped = 0
+
+    def show(self):
+        """
+        Send the last movement of the environment to the rendering process, or drop it if it is busy.
+        """
+        if self.queue.full():
+            self.n_dropped += 1
+            return
+        try:
+            self.queue.put_nowait(get_logs(self.env))
+            self.n_sent += 1
+        except Full:
+            self.n_dropped += 1
+
+    def close(self, timeout=5.):
+        """
+        Stop the rendering process once it has plotted its current movement: the waiting movements are dropped.
+        """
+        try:
+            while True:
+                self.queue.get_nowait()
+                self.n_dropped += 1
+        except Empty:
+            pass
+        try:
+            self.queue.put(None, timeout=timeout)
+        except Full:
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()